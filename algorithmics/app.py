@@ -1,12 +1,15 @@
+import functools
 import glob
 import json
 import os
 import re
-from typing import List, Tuple
+import threading
+import uuid
+from collections import OrderedDict
+from typing import Dict, List, Optional, Tuple
 
 import dash
 from dash import dcc, html
-import plotly.graph_objects as go
 from dash.dependencies import Input, Output, State
 
 from algorithmics.enemy.asteroids_zone import AsteroidsZone
@@ -20,6 +23,9 @@ from algorithmics.assets.generate_scatter import generate_path_scatter, generate
     generate_graph_layout
 
 
+_SCENARIO_RE = re.compile(r'.*scenario_(\d+)\.json')
+
+
 def _extract_scenario_number_from_path(path: str) -> int:
     """Extract the number of a scenario given its name in the file system
 
@@ -31,20 +37,13 @@ def _extract_scenario_number_from_path(path: str) -> int:
     :param path: path to scenario's JSON in the file system
     :return: scenario's number
     """
-    return int(re.match(r'.*scenario_(\d+)\.json', path).group(1))
-
-
-scenario_files = glob.glob('../resources/scenarios/scenario_*.json')
-scenario_files = ['resources/scenarios/scenario_1.json']
-
-print('--------------------------')
-print(os.listdir('resources'))
-print(os.listdir('resources/scenarios'))
+    return int(_SCENARIO_RE.match(path).group(1))
 
-print(len(scenario_files))
-print('--------------------------')
 
-scenario_files = sorted(scenario_files, key=lambda name: _extract_scenario_number_from_path(name))
+# Scenarios are listed once, as pairs of their number and path, sorted by number
+_SCENARIOS_DIR = os.path.normpath(os.path.join(os.path.dirname(__file__), '..', 'resources', 'scenarios'))
+SCENARIOS: List[Tuple[int, str]] = sorted((_extract_scenario_number_from_path(path), path)
+                                          for path in glob.glob(os.path.join(_SCENARIOS_DIR, 'scenario_*.json')))
 
 colors = {
     'background': '#111111',
@@ -61,10 +60,8 @@ app.layout = html.Div([
                                                      'color': colors['h1']}),
     html.Div(children=[
         dcc.Dropdown(id='scenario-dropdown',
-                     options=[{'label': f'Scenario #{_extract_scenario_number_from_path(filename)}',
-                               'value': filename}
-                              for filename in scenario_files],
-                     value=scenario_files[0],
+                     options=[{'label': f'Scenario #{number}', 'value': path} for number, path in SCENARIOS],
+                     value=SCENARIOS[0][1],
                      clearable=False,
                      style={'font-family': 'Courier New', 'font-weight': 'bold', 'color': colors['text'],
                             'margin-bottom': '10px', 'margin-right': '10px', 'font-size': '16px',
@@ -91,7 +88,8 @@ app.layout = html.Div([
                  style={'font-family': 'Courier New', 'font-weight': 'bold', 'background-color': 'black',
                         'color': 'white', 'width': '100%'}),
     dcc.Store(id='store-path', data=[]),
-    dcc.Store(id='store-edges', data=[])
+    dcc.Store(id='store-edges', data=[]),
+    dcc.Store(id='store-run', data=None)
 ], style={'margin-top': '20px', 'margin-left': '10px', 'margin-right': '10px'})
 
 
@@ -106,6 +104,12 @@ def update_path_text(path: List[Tuple[float, float]]) -> str:
 
 
 def _load_scenario(scenario_path: str) -> Tuple[Coordinate, Coordinate, List[Enemy]]:
+    # Scenarios are reloaded only when their file changes on disk
+    return _load_scenario_cached(scenario_path, os.path.getmtime(scenario_path))
+
+
+@functools.lru_cache(maxsize=32)
+def _load_scenario_cached(scenario_path: str, mtime: float) -> Tuple[Coordinate, Coordinate, List[Enemy]]:
     with open(scenario_path, 'r') as f:
         raw_scenario = json.load(f)
 
@@ -115,7 +119,7 @@ def _load_scenario(scenario_path: str) -> Tuple[Coordinate, Coordinate, List[Ene
     enemies: List[Enemy] = []
     enemies += [ObservationPost(Coordinate(raw_post['center'][0], raw_post['center'][1]), raw_post['radius'])
                 for raw_post in raw_scenario['observation_posts']]
-    enemies += [AsteroidsZone([Coordinate(c[0], c[1]) for c in raw_zone['boundary']])
+    enemies += [AsteroidsZone(Coordinate.from_pairs(raw_zone['boundary']))
                 for raw_zone in raw_scenario['asteroids_zones']]
     enemies += [Radar(Coordinate(raw_radar['center'][0], raw_radar['center'][1]), raw_radar['radius'])
                 for raw_radar in raw_scenario['radars']]
@@ -123,42 +127,69 @@ def _load_scenario(scenario_path: str) -> Tuple[Coordinate, Coordinate, List[Ene
     return source, target, enemies
 
 
+# Figures drawn lately, keyed by their scenario, run and whether the graph is shown. Runs are keyed by their id rather
+# than by their path and edges, which may hold millions of values
+_FIGURES_CACHE_SIZE = 4
+_figures_cache: Dict[Tuple, Dict] = OrderedDict()
+_figures_cache_lock = threading.Lock()
+
+
 @app.callback(Output('graph', 'figure'),
               Input('scenario-dropdown', 'value'),
               Input('store-path', 'data'),
               Input('store-edges', 'data'),
+              Input('store-run', 'data'),
               Input('graph-toggle', 'value'))
 def update_map(scenario_path: str, path: List[Tuple[float, float]],
-               edges: List[Tuple[float, float, float, float]], graph_on: str) -> go.Figure:
-    source, target, enemies = _load_scenario(scenario_path)
-
+               edges: List[Tuple[float, float, float, float]], run_id: Optional[str], graph_on: str) -> Dict:
     # If only scenario was changed, path and graph are empty
     if dash.callback_context.triggered[0]['prop_id'].split('.')[0] == 'scenario-dropdown':
-        draw_path, edges_scatter = [], []
-
-    # Otherwise, parse path and graph
+        path, edges, run_id, show_graph = [], [], None, False
     else:
-        draw_path = [Coordinate(c[0], c[1]) for c in path]
-        edges_scatter = [generate_graph_scatter(edges)] if len(graph_on) > 0 else []
+        show_graph = len(graph_on) > 0
+
+    # Figures are cached, so toggling the graph or switching back to a scenario is instant
+    key = (scenario_path, os.path.getmtime(scenario_path), run_id, show_graph)
+    with _figures_cache_lock:
+        if key in _figures_cache:
+            _figures_cache.move_to_end(key)
+            return _figures_cache[key]
+
+    figure = _build_figure(scenario_path, key[1], path, edges if show_graph else [], show_graph)
+    with _figures_cache_lock:
+        _figures_cache[key] = figure
+        while len(_figures_cache) > _FIGURES_CACHE_SIZE:
+            _figures_cache.popitem(last=False)
+    return figure
+
+
+def _build_figure(scenario_path: str, mtime: float, path: List[Tuple[float, float]],
+                  edges: List[Tuple[float, float, float, float]], show_graph: bool) -> Dict:
+    source, target, enemies = _load_scenario_cached(scenario_path, mtime)
+
+    draw_path = Coordinate.from_pairs(path)
+    edges_scatter = [generate_graph_scatter(edges)] if show_graph else []
 
     data = generate_all_scenario_scatters(source, target, enemies) + \
            [generate_path_scatter(draw_path, color='#cccccc')] + edges_scatter
-    return go.Figure(data=data,
-                     layout=generate_graph_layout())
+    return {'data': data, 'layout': generate_graph_layout()}
 
 
 @app.callback(Output('store-path', 'data'),
               Output('store-edges', 'data'),
+              Output('store-run', 'data'),
               Input('run-button', 'n_clicks'),
               State('scenario-dropdown', 'value'),
               prevent_initial_call=True)
 def run_button_n_clicks_changed(n_clicks: int, scenario_path: str) -> \
-        Tuple[List[Tuple[float, float]], List[Tuple[float, ...]]]:
+        Tuple[List[Tuple[float, float]], List[Tuple[float, ...]], str]:
     source, target, enemies = _load_scenario(scenario_path)
 
-    # Dash doesn't support custom return types from callbacks, so we convert the path into a list of tuples
+    # Dash doesn't support custom return types from callbacks, so we convert the path into a list of tuples. Every run
+    # gets a unique id, by which its figures are cached
     path, graph = calculate_path(source, target, enemies)
-    return [(c.x, c.y) for c in path], [(edge[0].x, edge[0].y, edge[1].x, edge[1].y) for edge in graph.edges]
+    return [(c.x, c.y) for c in path], [(edge[0].x, edge[0].y, edge[1].x, edge[1].y) for edge in graph.edges], \
+        uuid.uuid4().hex
 
 
 if __name__ == '__main__':
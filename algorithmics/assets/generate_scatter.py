@@ -1,137 +1,241 @@
-import math
-from typing import List, Tuple
+import functools
+from typing import Dict, List, Optional, Tuple
 
 from algorithmics.enemy.asteroids_zone import AsteroidsZone
 from algorithmics.enemy.enemy import Enemy
 from algorithmics.enemy.observation_post import ObservationPost
 from algorithmics.enemy.radar import Radar
 
-try:
-    import plotly.graph_objects as go
-except:
-    import plotly.graph_objs as go
+import plotly.io as pio
 
 from algorithmics.utils.coordinate import Coordinate
+from algorithmics.utils.geometry import unit_circle
+
+# Scatters and layouts are returned as plain dicts rather than plotly graph objects, which skips plotly's validation of
+# every property. Both Dash and `go.Figure` accept them as they are.
+# Filled enemy shapes stay SVG scatters, as WebGL scatters can not be hovered on their fills
 
 
 def generate_coordinate_scatter(coordinate: Coordinate, color: str = '#ff5500', hovertext=None, symbol: str = 'circle') \
-        -> go.Scatter:
+        -> Dict:
     """Converts the give coordinate into a displayable plotly scatter
 
     :param coordinate: coordinate to display
     :param color: color of the coordinate
     :param hovertext: text to appear on mouse hover
-    :return: plotly scatter graphics object containing the circle
+    :return: plotly scatter trace containing the circle
+    """
+    scatter = {'type': 'scatter', 'x': [coordinate.x], 'y': [coordinate.y], 'mode': 'markers+text',
+               'hoverinfo': 'skip' if hovertext is None else 'name',
+               'textposition': 'top center',
+               'marker': {'color': color, 'size': 13, 'symbol': symbol}}
+    if hovertext is not None:
+        scatter['name'] = hovertext
+    return scatter
+
+
+def generate_coordinates_scatter(coordinates: List[Coordinate], colors: List[str], hovertexts: List[str],
+                                 symbols: List[str]) -> Dict:
+    """Converts the given coordinates into a single displayable plotly scatter
+
+    :param coordinates: coordinates to display
+    :param colors: color of every coordinate
+    :param hovertexts: text to appear on mouse hover over every coordinate
+    :param symbols: marker symbol of every coordinate
+    :return: plotly scatter trace containing the coordinates
     """
-    return go.Scatter(x=[coordinate.x], y=[coordinate.y], mode='markers+text',
-                      hoverinfo='skip' if hovertext is None else 'name', name=hovertext,
-                      textposition='top center',
-                      marker=go.scatter.Marker(color=color, size=13, symbol=symbol))
+    return {'type': 'scatter',
+            'x': [coordinate.x for coordinate in coordinates], 'y': [coordinate.y for coordinate in coordinates],
+            'mode': 'markers', 'hoverinfo': 'text', 'hovertext': hovertexts,
+            'marker': {'color': colors, 'size': 13, 'symbol': symbols}}
 
 
 def generate_circle_scatter(center: Coordinate, radius: float, vertices_amount: int = 60,
-                            color: str = '#ff5500', hover_text=None) -> go.Scatter:
+                            color: str = '#ff5500', hover_text=None) -> Dict:
     """Converts the given circle into a displayable plotly scatter
 
     :param center: circle's center
     :param radius: circle's radius
     :param vertices_amount: how many vertices the calculated circle will have (discretization factor)
-    :return: plotly scatter graphics object containing the circle
+    :return: plotly scatter trace containing the circle
     """
-    xs = []
-    ys = []
-    for i in list(range(vertices_amount)) + [0]:  # Iterate again over 0 to close the circle
-        angle = (360.0 / vertices_amount) * i
-        delta_x = math.sin(math.radians(angle)) * radius
-        delta_y = math.cos(math.radians(angle)) * radius
-
-        xs.append(center.x + delta_x)
-        ys.append(center.y + delta_y)
-
-    return go.Scatter(x=xs, y=ys,
-                      hoveron='fills',
-                      hoverinfo='skip' if hover_text is None else 'text',
-                      text=hover_text,
-                      fill='toself',
-                      fillcolor=f'rgba{(*_hex_to_rgb(color), 0.3)}',
-                      line=go.scatter.Line(color=color, width=3))
-
-
-def generate_path_scatter(path: List[Coordinate], color: str = '#47d147') -> go.Scatter:
+    sines, cosines = unit_circle(vertices_amount)
+    xs = (center.x + radius * sines).tolist()
+    ys = (center.y + radius * cosines).tolist()
+    # Repeat the first vertex to close the circle
+    xs.append(xs[0])
+    ys.append(ys[0])
+
+    scatter = {'type': 'scatter', 'x': xs, 'y': ys,
+               'hoveron': 'fills',
+               'hoverinfo': 'skip' if hover_text is None else 'text',
+               'fill': 'toself',
+               'fillcolor': _rgba_string(color, 0.3),
+               'line': {'color': color, 'width': 3}}
+    if hover_text is not None:
+        scatter['text'] = hover_text
+    return scatter
+
+
+def generate_circles_scatter(centers: List[Coordinate], radii: List[float], vertices_amount: int = 60,
+                             color: str = '#ff5500', hover_label: Optional[str] = None) -> Dict:
+    """Converts the given circles into a single displayable plotly scatter
+
+    Circles are separated by `None` values, so each of them is drawn and filled as a separate shape
+
+    :param centers: circles' centers
+    :param radii: circles' radii
+    :param vertices_amount: how many vertices every calculated circle will have (discretization factor)
+    :param hover_label: text to appear on mouse hover over any of the circles
+    :return: plotly scatter trace containing the circles
+    """
+    sines, cosines = unit_circle(vertices_amount)
+    xs, ys = [], []
+    for center, radius in zip(centers, radii):
+        circle_xs = (center.x + radius * sines).tolist()
+        circle_ys = (center.y + radius * cosines).tolist()
+        # Repeat the first vertex to close the circle
+        xs += circle_xs + [circle_xs[0], None]
+        ys += circle_ys + [circle_ys[0], None]
+
+    return _generate_shapes_scatter(xs, ys, color, hover_label)
+
+
+def generate_path_scatter(path: List[Coordinate], color: str = '#47d147') -> Dict:
     """Converts a path into a displayable plotly scatter
 
     :param path: path to be converted
     :param color: scatter's color
-    :return: plotly scatter graphics object displaying the path
+    :return: plotly scatter trace displaying the path
     """
     xs = [coordinate.x for coordinate in path]
     ys = [coordinate.y for coordinate in path]
 
-    return go.Scatter(x=xs, y=ys, hoverinfo='skip', mode='lines+markers',
-                      line=go.scatter.Line(color=color, width=3))
+    # Paths may hold many points, so they are rendered with WebGL rather than SVG
+    return {'type': 'scattergl', 'x': xs, 'y': ys, 'hoverinfo': 'skip', 'mode': 'lines+markers',
+            'line': {'color': color, 'width': 3}}
 
 
-def generate_graph_scatter(edges: List[Tuple[float, float, float, float]], color: str = '#0099FF') -> go.Scatter:
+def generate_graph_scatter(edges: List[Tuple[float, float, float, float]], color: str = '#0099FF') -> Dict:
     """Converts a path into a displayable plotly scatter
 
     :param edges: list of edges
     :param color: scatter's color
-    :return: plotly scatter graphics object displaying the path
+    :return: plotly scatter trace displaying the path
     """
     xs = [x for pairs in [[edge[0], edge[2], None] for edge in edges] for x in pairs]
     ys = [y for pairs in [[edge[1], edge[3], None] for edge in edges] for y in pairs]
 
-    return go.Scatter(x=xs, y=ys, hoverinfo='skip', mode='lines+markers',
-                      line=go.scatter.Line(color=color, width=3))
+    # Graphs may hold hundreds of thousands of edges, so they are rendered with WebGL rather than SVG
+    return {'type': 'scattergl', 'x': xs, 'y': ys, 'hoverinfo': 'skip', 'mode': 'lines+markers',
+            'line': {'color': color, 'width': 3}}
 
 
-def generate_polygon_scatter(boundary: List[Coordinate], color: str = '#00ff00', hover_text=None) -> go.Scatter:
+def generate_polygon_scatter(boundary: List[Coordinate], color: str = '#00ff00', hover_text=None) -> Dict:
     """Converts the given polygon into a displayable plotly scatter
 
     :param boundary: polygon's boundary
     :param color: scatter's color
-    :return: plotly scatter graphics object displaying the path
+    :return: plotly scatter trace displaying the path
     """
     xs = [coordinate.x for coordinate in boundary] + [boundary[0].x]
     ys = [coordinate.y for coordinate in boundary] + [boundary[0].y]
 
-    return go.Scatter(x=xs, y=ys,
-                      hoverinfo='skip' if hover_text is None else 'text',
-                      text=hover_text, fill='toself', mode='lines',
-                      fillcolor=f'rgba{(*_hex_to_rgb(color), 0.3)}',
-                      line=go.scatter.Line(color=color, width=3))
+    scatter = {'type': 'scatter', 'x': xs, 'y': ys,
+               'hoverinfo': 'skip' if hover_text is None else 'text',
+               'fill': 'toself', 'mode': 'lines',
+               'fillcolor': _rgba_string(color, 0.3),
+               'line': {'color': color, 'width': 3}}
+    if hover_text is not None:
+        scatter['text'] = hover_text
+    return scatter
+
+
+def generate_polygons_scatter(boundaries: List[List[Coordinate]], color: str = '#00ff00',
+                              hover_label: Optional[str] = None) -> Dict:
+    """Converts the given polygons into a single displayable plotly scatter
+
+    Polygons are separated by `None` values, so each of them is drawn and filled as a separate shape
+
+    :param boundaries: polygons' boundaries
+    :param color: scatter's color
+    :param hover_label: text to appear on mouse hover over any of the polygons
+    :return: plotly scatter trace displaying the polygons
+    """
+    xs, ys = [], []
+    for boundary in boundaries:
+        # Repeat the first vertex to close the polygon
+        xs += [coordinate.x for coordinate in boundary] + [boundary[0].x, None]
+        ys += [coordinate.y for coordinate in boundary] + [boundary[0].y, None]
+
+    return _generate_shapes_scatter(xs, ys, color, hover_label)
 
 
-def generate_all_scenario_scatters(source: Coordinate, target: Coordinate, enemies: List[Enemy]) -> List[go.Scatter]:
+def _generate_shapes_scatter(xs: List[Optional[float]], ys: List[Optional[float]], color: str,
+                             hover_label: Optional[str]) -> Dict:
+    """Generate a filled scatter of several shapes, given their vertices separated by `None` values
+
+    :param xs: x values of the shapes' vertices
+    :param ys: y values of the shapes' vertices
+    :param color: scatter's color
+    :param hover_label: text to appear on mouse hover over any of the shapes
+    :return: plotly scatter trace displaying the shapes
+    """
+    # Hovering on fills displays only the text of the whole trace, as plotly ignores hover templates and per-vertex data
+    # of fills. Therefore, all the shapes of a scatter share a single label
+    scatter = {'type': 'scatter', 'x': xs, 'y': ys,
+               'hoveron': 'fills',
+               'hoverinfo': 'skip' if hover_label is None else 'text',
+               'fill': 'toself', 'mode': 'lines',
+               'fillcolor': _rgba_string(color, 0.3),
+               'line': {'color': color, 'width': 3}}
+    if hover_label is not None:
+        scatter['text'] = hover_label
+    return scatter
+
+
+def generate_all_scenario_scatters(source: Coordinate, target: Coordinate, enemies: List[Enemy]) -> List[Dict]:
     """Generate all scatter objects needed for a given scenario
 
     :param enemies:
     :return:
     """
-    posts = [generate_circle_scatter(post.center, post.radius, color='#ffa31a', hover_text=f'Observation Post {i + 1}')
-             for i, post in enumerate(e for e in enemies if isinstance(e, ObservationPost))]
-    zones = [generate_polygon_scatter(zone.boundary, color='#4dc3ff', hover_text=f'Asteroids Zone {i + 1}')
-             for i, zone in enumerate(e for e in enemies if isinstance(e, AsteroidsZone))]
-    radars = [generate_circle_scatter(radar.center, radar.radius, color='#ff0080', hover_text=f'Radar {i + 1}')
-              for i, radar in enumerate(e for e in enemies if isinstance(e, Radar))]
-    endpoints = [generate_coordinate_scatter(source, color='#bfff80', hovertext='source', symbol='triangle-ne'),
-                 generate_coordinate_scatter(target, color='#ff704d', hovertext='target', symbol='diamond')]
+    # Every kind of enemy is drawn as a single scatter, keeping the amount of traces constant
+    posts = [e for e in enemies if isinstance(e, ObservationPost)]
+    zones = [e for e in enemies if isinstance(e, AsteroidsZone)]
+    radars = [e for e in enemies if isinstance(e, Radar)]
 
-    return posts + zones + radars + endpoints
+    return [generate_circles_scatter([post.center for post in posts], [post.radius for post in posts], color='#ffa31a',
+                                     hover_label='Observation Post'),
+            generate_polygons_scatter([zone.boundary for zone in zones], color='#4dc3ff', hover_label='Asteroids Zone'),
+            generate_circles_scatter([radar.center for radar in radars], [radar.radius for radar in radars],
+                                     color='#ff0080', hover_label='Radar'),
+            generate_coordinates_scatter([source, target], colors=['#bfff80', '#ff704d'],
+                                         hovertexts=['source', 'target'], symbols=['triangle-ne', 'diamond'])]
 
 
-def generate_graph_layout() -> go.Layout:
+def generate_graph_layout() -> Dict:
     """Generate layout for the graph
 
     :return: graph layout
     """
-    return go.Layout(dragmode='pan',
-                     yaxis={'scaleanchor': 'x'},
-                     showlegend=False,
-                     template='plotly_dark',
-                     margin=go.layout.Margin(l=0, r=0, b=0, t=0))
+    return {'dragmode': 'pan',
+            'yaxis': {'scaleanchor': 'x'},
+            'showlegend': False,
+            'template': _dark_template(),
+            'margin': {'l': 0, 'r': 0, 'b': 0, 't': 0}}
+
+
+@functools.lru_cache(maxsize=1)
+def _dark_template() -> Dict:
+    """Resolve plotly's dark template into a dict, as only plotly graph objects resolve templates by their name
+
+    :return: plotly's dark template
+    """
+    return pio.templates['plotly_dark'].to_plotly_json()
 
 
+@functools.lru_cache(maxsize=128)
 def _hex_to_rgb(hex_color: str) -> Tuple[int, int, int]:
     """Converts a color in hex-string representation to a tuple of (R,G,B) values in decimals
 
@@ -142,3 +246,14 @@ def _hex_to_rgb(hex_color: str) -> Tuple[int, int, int]:
     if len(hex_color) == 3:
         hex_color = hex_color * 2
     return int(hex_color[0:2], 16), int(hex_color[2:4], 16), int(hex_color[4:6], 16)
+
+
+@functools.lru_cache(maxsize=128)
+def _rgba_string(hex_color: str, alpha: float) -> str:
+    """Converts a color in hex-string representation and an opacity to a plotly `rgba(...)` color string
+
+    :param hex_color: color hex value as a string in the form of `#RRGGBB` or `#RGB`
+    :param alpha: opacity of the color, between 0 and 1
+    :return: color as a string in the form of `rgba(R, G, B, A)`
+    """
+    return f'rgba{(*_hex_to_rgb(hex_color), alpha)}'
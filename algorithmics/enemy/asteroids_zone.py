@@ -1,9 +1,12 @@
-from typing import List
+from typing import List, Optional
 
+import numpy as np
+import shapely
 from shapely.geometry import Polygon, LineString
 
 from algorithmics.enemy.enemy import Enemy
 from algorithmics.utils.coordinate import Coordinate
+from algorithmics.utils.geometry import classify_segments_against_polygon
 
 
 class AsteroidsZone(Enemy):
@@ -14,8 +17,55 @@ class AsteroidsZone(Enemy):
         :param boundary: list of coordiantes representing the boundary of the asteroids zone
         """
         self.boundary = boundary
-        self._polygon = Polygon([[c.x, c.y] for c in self.boundary]).buffer(-1e-6)
+        self.xy = Coordinate.to_array(self.boundary)
+        self._edges = np.stack([self.xy, np.roll(self.xy, -1, axis=0)], axis=1)
+        self._polygon = Polygon(self.xy).buffer(-1e-6)
+        self._bbox = self._polygon.bounds
+        shapely.prepare(self._polygon)
+
+    def fast_segment_reject(self, start: Coordinate, end: Coordinate) -> Optional[bool]:
+        # A leg whose bounding box is disjoint from the zone's bounding box can not cross the zone
+        min_x, min_y, max_x, max_y = self._bbox
+        if max(start.x, end.x) < min_x or min(start.x, end.x) > max_x or \
+                max(start.y, end.y) < min_y or min(start.y, end.y) > max_y:
+            return True
+        return None
 
     def is_legal_leg(self, start: Coordinate, end: Coordinate) -> bool:
         leg = LineString([[start.x, start.y], [end.x, end.y]])
         return not self._polygon.intersects(leg)
+
+    def are_legal_legs(self, starts: np.ndarray, ends: np.ndarray) -> np.ndarray:
+        """Check a batch of legs at once, using GEOS only for legs touching the boundary of the zone
+
+        :param starts: array of shape (M, 2) holding the start point of every leg
+        :param ends: array of shape (M, 2) holding the end point of every leg
+        :return: boolean array of shape (M,), True for every leg that is legal
+        """
+        # Legs whose bounding box is disjoint from the zone's bounding box can not cross the zone, so only the rest are
+        # tested against the edges of the zone
+        min_x, min_y, max_x, max_y = self._bbox
+        near = np.flatnonzero((np.maximum(starts[:, 0], ends[:, 0]) >= min_x) &
+                              (np.minimum(starts[:, 0], ends[:, 0]) <= max_x) &
+                              (np.maximum(starts[:, 1], ends[:, 1]) >= min_y) &
+                              (np.minimum(starts[:, 1], ends[:, 1]) <= max_y))
+        legal = np.ones(len(starts), dtype=bool)
+        if len(near) > 0:
+            legal[near] = self._are_near_legs_legal(starts[near], ends[near])
+        return legal
+
+    def _are_near_legs_legal(self, starts: np.ndarray, ends: np.ndarray) -> np.ndarray:
+        crossing, touching = classify_segments_against_polygon(starts, ends, self._edges)
+
+        # Legs properly crossing the boundary surely enter the zone, while legs that do not meet the boundary at all are
+        # either entirely inside the zone or entirely outside of it, so their midpoint decides
+        legal = ~crossing
+        apart = np.flatnonzero(~crossing & ~touching)
+        midpoints = (starts[apart] + ends[apart]) / 2
+        legal[apart] = ~shapely.intersects_xy(self._polygon, midpoints[:, 0], midpoints[:, 1])
+
+        # Only legs touching the boundary are left for the exact test of GEOS
+        touching = np.flatnonzero(touching)
+        legs = shapely.linestrings(np.stack([starts[touching], ends[touching]], axis=1))
+        legal[touching] = ~shapely.intersects(self._polygon, legs)
+        return legal
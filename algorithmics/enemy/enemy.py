@@ -1,4 +1,7 @@
 from abc import ABC, abstractmethod
+from typing import Optional
+
+import numpy as np
 
 from algorithmics.utils.coordinate import Coordinate
 
@@ -14,3 +17,38 @@ class Enemy(ABC):
         :return: True if the leg it legal for movement, False otherwise
         """
         pass
+
+    def fast_segment_reject(self, start: Coordinate, end: Coordinate) -> Optional[bool]:
+        """Try to decide the legality of the movement from start to end using a cheap test only
+
+        :param start: initial coordinate of the movement
+        :param end: final coordinate of the movement
+        :return: True if the leg is surely legal, False if it is surely illegal and None if the test is inconclusive
+        """
+        return None
+
+    def are_legal_legs(self, starts: np.ndarray, ends: np.ndarray) -> np.ndarray:
+        """Check a batch of movements at once, regarding that enemy
+
+        Enemies that can test many legs faster than one by one should override this method, keeping the result of
+        `is_legal_leg` for every leg:
+
+        >>> from algorithmics.enemy.asteroids_zone import AsteroidsZone
+        >>> from algorithmics.enemy.observation_post import ObservationPost
+        >>> from algorithmics.enemy.radar import Radar
+        >>> enemies = [ObservationPost(Coordinate(0, 0), 3), Radar(Coordinate(0, 0), 3),
+        ...            AsteroidsZone([Coordinate(-3, -1), Coordinate(2, -4), Coordinate(4, 3), Coordinate(0, 1)])]
+        >>> rng = np.random.default_rng(0)
+        >>> starts = rng.uniform(-5, 5, (2000, 2))
+        >>> ends = starts + rng.normal(0, 2, (2000, 2))
+        >>> legs = [(Coordinate(*start), Coordinate(*end)) for start, end in zip(starts.tolist(), ends.tolist())]
+        >>> [np.array_equal(enemy.are_legal_legs(starts, ends), [enemy.is_legal_leg(*leg) for leg in legs])
+        ...  for enemy in enemies]
+        [True, True, True]
+
+        :param starts: array of shape (M, 2) holding the initial coordinate of every movement
+        :param ends: array of shape (M, 2) holding the final coordinate of every movement
+        :return: boolean array of shape (M,), True for every leg that is legal for movement
+        """
+        return np.array([self.is_legal_leg(Coordinate(*start), Coordinate(*end))
+                         for start, end in zip(starts.tolist(), ends.tolist())], dtype=bool)
@@ -1,10 +1,13 @@
 import math
-from typing import List
+from typing import List, Optional
 
-from shapely.geometry import Point, LineString
+import numpy as np
+import shapely
+from shapely.geometry import Point
 
 from algorithmics.enemy.enemy import Enemy
 from algorithmics.utils.coordinate import Coordinate
+from algorithmics.utils.geometry import segments_clear_of_circles, unit_circle
 
 
 class ObservationPost(Enemy):
@@ -17,8 +20,13 @@ class ObservationPost(Enemy):
         """
         self.center = center
         self.radius = radius
+        self.center_xy = np.array([center.x, center.y], dtype=np.float64)
 
+        # Legs are tested against a polygon inscribed in a circle slightly smaller than the post. Legs passing within the
+        # inradius of the polygon surely enter it, and only legs passing between it and the circle are tested by GEOS
         self._circle = Point(self.center.x, self.center.y).buffer(self.radius - 1e-6)
+        self._inradius = Point(self.center.x, self.center.y).distance(self._circle.exterior)
+        shapely.prepare(self._circle)
 
     def approximate_boundary(self, n: int = 20) -> List[Coordinate]:
         """Compute polygon approximating the boundary of the post
@@ -29,12 +37,32 @@ class ObservationPost(Enemy):
         :return: polygon approximating the circle
         """
 
-        angle_step = math.radians(360 / n)
-        buffed_radius = self.radius / math.cos(angle_step / 2)
-        return [Coordinate(self.center.x + buffed_radius * math.sin(i * angle_step),
-                           self.center.y + buffed_radius * math.cos(i * angle_step))
-                for i in range(n)]
+        sines, cosines = unit_circle(n)
+        buffed_radius = self.radius / math.cos(math.pi / n)
+        xs = self.center.x + buffed_radius * sines
+        ys = self.center.y + buffed_radius * cosines
+        return [Coordinate(x, y) for x, y in zip(xs.tolist(), ys.tolist())]
+
+    def fast_segment_reject(self, start: Coordinate, end: Coordinate) -> Optional[bool]:
+        # A leg that keeps its distance from the center never enters the post
+        if self.center.distance_to_segment(start, end) >= self.radius:
+            return True
+
+        # Legs inside the post are left for the exact test, since the polygon it uses lies strictly inside the circle
+        return None
 
     def is_legal_leg(self, start: Coordinate, end: Coordinate) -> bool:
-        leg = LineString([[start.x, start.y], [end.x, end.y]])
-        return not self._circle.intersects(leg)
+        # A single leg is tested by the batch test, so that both apply the same rule
+        return bool(self.are_legal_legs(np.array([[start.x, start.y]]), np.array([[end.x, end.y]]))[0])
+
+    def are_legal_legs(self, starts: np.ndarray, ends: np.ndarray) -> np.ndarray:
+        # Legs keeping out of the post never meet the polygon inside it, while legs entering the inradius of the polygon
+        # surely meet it
+        legal = segments_clear_of_circles(starts, ends, self.center_xy[None, :], np.array([self.radius + 1e-6]))
+        undecided = np.flatnonzero(~legal & segments_clear_of_circles(starts, ends, self.center_xy[None, :],
+                                                                       np.array([self._inradius])))
+
+        # Only legs passing between the polygon and the circle are left for the exact test of GEOS
+        legs = shapely.linestrings(np.stack([starts[undecided], ends[undecided]], axis=1))
+        legal[undecided] = ~shapely.intersects(self._circle, legs)
+        return legal
@@ -1,10 +1,14 @@
 import math
-from typing import List
+from typing import List, Optional
 
-from shapely.geometry import Point, LineString
+import numpy as np
+from shapely.geometry import Point
 
 from algorithmics.enemy.enemy import Enemy
 from algorithmics.utils.coordinate import Coordinate
+from algorithmics.utils.geometry import unit_circle
+
+_RADAR_DIR_THRESHOLD = math.radians(45)
 
 
 class Radar(Enemy):
@@ -17,7 +21,9 @@ class Radar(Enemy):
         """
         self.center = center
         self.radius = radius
+        self.center_xy = np.array([center.x, center.y], dtype=np.float64)
 
+        # Used for sampling inside the radar, detection itself is computed analytically
         self.circle = Point(self.center.x, self.center.y).buffer(self.radius)
 
     def approximate_boundary(self, n: int = 30) -> List[Coordinate]:
@@ -29,11 +35,11 @@ class Radar(Enemy):
         :return: polygon approximating the circle
         """
 
-        angle_step = math.radians(360 / n)
-        buffed_radius = self.radius / math.cos(angle_step / 2)
-        return [Coordinate(self.center.x + buffed_radius * math.sin(i * angle_step),
-                           self.center.y + buffed_radius * math.cos(i * angle_step))
-                for i in range(n)]
+        sines, cosines = unit_circle(n)
+        buffed_radius = self.radius / math.cos(math.pi / n)
+        xs = self.center.x + buffed_radius * sines
+        ys = self.center.y + buffed_radius * cosines
+        return [Coordinate(x, y) for x, y in zip(xs.tolist(), ys.tolist())]
 
     @staticmethod
     def _compute_direction_diff(direction1: float, direction2: float):
@@ -46,16 +52,76 @@ class Radar(Enemy):
             return angle_diff - math.pi
         return 2 * math.pi - angle_diff
 
+    def fast_segment_reject(self, start: Coordinate, end: Coordinate) -> Optional[bool]:
+        # A leg that keeps its distance from the radar is never detected. Otherwise, detection depends on the direction
+        # of the movement, which is left for the exact test
+        if self.center.distance_to_segment(start, end) >= self.radius:
+            return True
+        return None
+
     def is_legal_leg(self, start: Coordinate, end: Coordinate) -> bool:
 
-        radar_intersection = LineString([[start.x, start.y], [end.x, end.y]]).intersection(self.circle)
-        if radar_intersection.length == 0:
+        # Find where the leg enters and exits the radar by solving |start + t * (end - start) - center|² = radius²
+        dx, dy = end.x - start.x, end.y - start.y
+        fx, fy = start.x - self.center.x, start.y - self.center.y
+        a = dx ** 2 + dy ** 2
+        b = 2 * (fx * dx + fy * dy)
+        c = fx ** 2 + fy ** 2 - self.radius ** 2
+        discriminant = b ** 2 - 4 * a * c
+        if a == 0 or discriminant <= 0:
             return True
 
-        start = Coordinate(radar_intersection.coords[0][0], radar_intersection.coords[0][1])
-        end = Coordinate(radar_intersection.coords[1][0], radar_intersection.coords[1][1])
-        movement_direction = start.direction_to(end)
-        for p in [start, end]:
-            if self._compute_direction_diff(movement_direction, p.direction_to(self.center)) < math.radians(45):
+        # Clamp the solutions to the leg itself. If nothing is left, the leg does not pass through the radar
+        root = math.sqrt(discriminant)
+        t_enter = max(0.0, (-b - root) / (2 * a))
+        t_exit = min(1.0, (-b + root) / (2 * a))
+        if t_enter >= t_exit:
+            return True
+
+        # Note: reversing the leg swaps its enter and exit points and turns its direction by pi, which the direction
+        # difference ignores, so detection does not depend on the direction of the leg
+        enter = Coordinate(start.x + t_enter * dx, start.y + t_enter * dy)
+        leave = Coordinate(start.x + t_exit * dx, start.y + t_exit * dy)
+        movement_direction = enter.direction_to(leave)
+        for p in [enter, leave]:
+            if self._compute_direction_diff(movement_direction, p.direction_to(self.center)) < _RADAR_DIR_THRESHOLD:
                 return False
         return True
+
+    def are_legal_legs(self, starts: np.ndarray, ends: np.ndarray) -> np.ndarray:
+        # Same computation as `is_legal_leg`, done for all legs at once
+        center_x, center_y = self.center_xy.tolist()
+        dxs, dys = ends[:, 0] - starts[:, 0], ends[:, 1] - starts[:, 1]
+        fxs, fys = starts[:, 0] - center_x, starts[:, 1] - center_y
+        a = dxs * dxs + dys * dys
+        b = 2 * (fxs * dxs + fys * dys)
+        c = fxs * fxs + fys * fys - self.radius ** 2
+        discriminant = b * b - 4 * a * c
+
+        # Only legs passing through the radar are left for the direction test
+        legal = np.ones(len(starts), dtype=bool)
+        passing = np.flatnonzero((a != 0) & (discriminant > 0))
+        a, b, root = a[passing], b[passing], np.sqrt(discriminant[passing])
+        t_enter = np.maximum(0.0, (-b - root) / (2 * a))
+        t_exit = np.minimum(1.0, (-b + root) / (2 * a))
+        inside = t_enter < t_exit
+        passing, t_enter, t_exit = passing[inside], t_enter[inside], t_exit[inside]
+
+        start_xs, start_ys, dxs, dys = starts[passing, 0], starts[passing, 1], dxs[passing], dys[passing]
+        enter_xs, enter_ys = start_xs + t_enter * dxs, start_ys + t_enter * dys
+        leave_xs, leave_ys = start_xs + t_exit * dxs, start_ys + t_exit * dys
+        movement_directions = np.arctan2(leave_ys - enter_ys, leave_xs - enter_xs)
+        detected = np.zeros(len(passing), dtype=bool)
+        for xs, ys in [(enter_xs, enter_ys), (leave_xs, leave_ys)]:
+            directions_to_center = np.arctan2(center_y - ys, center_x - xs)
+            detected |= self._compute_direction_diffs(movement_directions, directions_to_center) < _RADAR_DIR_THRESHOLD
+
+        legal[passing] = ~detected
+        return legal
+
+    @staticmethod
+    def _compute_direction_diffs(directions1: np.ndarray, directions2: np.ndarray) -> np.ndarray:
+        # Same as `_compute_direction_diff`, for arrays of directions
+        angle_diffs = (directions1 - directions2) % (2 * math.pi)
+        return np.select([angle_diffs <= math.pi / 2, angle_diffs <= math.pi, angle_diffs <= 3 * math.pi / 2],
+                         [angle_diffs, math.pi - angle_diffs, angle_diffs - math.pi], 2 * math.pi - angle_diffs)
@@ -1,12 +1,17 @@
-from itertools import combinations
+from concurrent.futures import ThreadPoolExecutor
 from typing import List, Tuple
 
 import networkx as nx
+import numpy as np
+from scipy.sparse import csr_matrix
 
 from algorithmics.enemy.asteroids_zone import AsteroidsZone
 from algorithmics.enemy.enemy import Enemy
 from algorithmics.enemy.observation_post import ObservationPost
 from algorithmics.utils.coordinate import Coordinate
+from algorithmics.utils.graph import shortest_path
+
+LEGS_PER_CHUNK = 20000
 
 
 def add_enemies_to_graph(graph: nx.Graph, enemies: List[Enemy]) -> None:
@@ -37,7 +42,42 @@ def is_legal_leg(start: Coordinate, end: Coordinate, enemies: List[Enemy]) -> bo
     :param enemies: enemies to be considered
     :return: True if the leg is legal, False otherwise
     """
-    return all(enemy.is_legal_leg(start, end) for enemy in enemies)
+    for enemy in enemies:
+        # Try the cheap test first, and fall back to the exact one only if it is inconclusive
+        legal = enemy.fast_segment_reject(start, end)
+        if legal is None:
+            legal = enemy.is_legal_leg(start, end)
+        if not legal:
+            return False
+    return True
+
+
+def _are_legal_legs_chunk(starts: np.ndarray, ends: np.ndarray, enemies: List[Enemy]) -> np.ndarray:
+    # Every enemy tests at once all the legs that are still legal
+    legal = np.ones(len(starts), dtype=bool)
+    for enemy in enemies:
+        candidates = np.flatnonzero(legal)
+        legal[candidates] = enemy.are_legal_legs(starts[candidates], ends[candidates])
+    return legal
+
+
+def are_legal_legs(starts: np.ndarray, ends: np.ndarray, enemies: List[Enemy]) -> np.ndarray:
+    """Assert, for a batch of movements, which of them are legal regarding all enemies
+
+    Large batches are split into chunks that are checked concurrently. The heavy lifting is done inside NumPy and GEOS,
+    which both release the GIL, so threads are enough to use all cores.
+
+    :param starts: array of shape (M, 2) holding the start of every movement
+    :param ends: array of shape (M, 2) holding the destination of every movement
+    :param enemies: enemies to be considered
+    :return: boolean array of shape (M,), True for every legal movement
+    """
+    if len(starts) <= LEGS_PER_CHUNK:
+        return _are_legal_legs_chunk(starts, ends, enemies)
+
+    chunks = [(starts[i:i + LEGS_PER_CHUNK], ends[i:i + LEGS_PER_CHUNK]) for i in range(0, len(starts), LEGS_PER_CHUNK)]
+    with ThreadPoolExecutor() as executor:
+        return np.concatenate(list(executor.map(lambda chunk: _are_legal_legs_chunk(*chunk, enemies), chunks)))
 
 
 def calculate_path(source: Coordinate, target: Coordinate, enemies: List[Enemy]) -> Tuple[List[Coordinate], nx.Graph]:
@@ -65,19 +105,28 @@ def calculate_path(source: Coordinate, target: Coordinate, enemies: List[Enemy])
     # Add corners of no-entrance zones to the graph
     add_enemies_to_graph(graph, enemies)
 
+    # Nodes are identified by their index in `nodes`, so that all computations work on integer ids and arrays
+    nodes = list(graph.nodes)
+    node_ids = {node: i for i, node in enumerate(nodes)}
+
     # For every pair of nodes, try to connect them
-    for node1, node2 in combinations(graph.nodes, 2):
-        # If the connection is legal, add the edge to the graph
-        if is_legal_leg(node1, node2, enemies):
-            graph.add_edge(node1, node2, dist=node1.distance_to(node2))
-
-    # Try computing the shortest path
-    try:
-        print('Computing path')
-        path = nx.shortest_path(graph, source, target, weight='dist')
-    # If no such path exists, return an empty path
-    except nx.NetworkXNoPath:
-        path = []
+    points = Coordinate.to_array(nodes)
+    first, second = np.triu_indices(len(nodes), 1)
+    legal = are_legal_legs(points[first], points[second], enemies)
+    first, second = first[legal], second[legal]
+
+    # Compute the distance of every legal pair once, for both of its directions
+    dists = np.hypot(points[second, 0] - points[first, 0], points[second, 1] - points[first, 1])
+
+    # Compute the shortest path over a sparse adjacency matrix of the graph, where every edge is stored once and
+    # traversed in both directions
+    print('Computing path')
+    adjacency = csr_matrix((dists, (first, second)), shape=(len(nodes), len(nodes)))
+    path = [nodes[i] for i in shortest_path(adjacency, node_ids[source], node_ids[target], directed=False)]
+
+    # Add the legal connections to the graph, which is returned for display
+    graph.add_edges_from((nodes[i], nodes[j], {'dist': dist})
+                         for i, j, dist in zip(first.tolist(), second.tolist(), dists.tolist()))
 
     print('Returning path')
     return path, graph
@@ -1,19 +1,23 @@
-import random
-from itertools import combinations
+from concurrent.futures import ThreadPoolExecutor
 from typing import List, Tuple
 
 import networkx as nx
-from shapely.geometry import Point, Polygon
-from tqdm import tqdm
+import numpy as np
+import shapely
+from scipy.sparse import csr_matrix
+from scipy.spatial import cKDTree
+from shapely.geometry import Polygon
 
 from algorithmics.enemy.asteroids_zone import AsteroidsZone
 from algorithmics.enemy.enemy import Enemy
 from algorithmics.enemy.observation_post import ObservationPost
 from algorithmics.enemy.radar import Radar
 from algorithmics.utils.coordinate import Coordinate
+from algorithmics.utils.graph import shortest_path
 
 SAMPLES = 2000
 EDGE_RADIUS = 5
+LEGS_PER_CHUNK = 20000
 
 
 # Stage 1 methods
@@ -47,67 +51,121 @@ def is_legal_leg(start: Coordinate, end: Coordinate, enemies: List[Enemy]) -> bo
     :param enemies: enemies to be considered
     :return: True if the leg is legal, False otherwise
     """
-    return all(enemy.is_legal_leg(start, end) for enemy in enemies)
+    for enemy in enemies:
+        # Try the cheap test first, and fall back to the exact one only if it is inconclusive
+        legal = enemy.fast_segment_reject(start, end)
+        if legal is None:
+            legal = enemy.is_legal_leg(start, end)
+        if not legal:
+            return False
+    return True
+
+
+def _are_legal_legs_chunk(starts: np.ndarray, ends: np.ndarray, enemies: List[Enemy]) -> np.ndarray:
+    # Every enemy tests at once all the legs that are still legal
+    legal = np.ones(len(starts), dtype=bool)
+    for enemy in enemies:
+        candidates = np.flatnonzero(legal)
+        legal[candidates] = enemy.are_legal_legs(starts[candidates], ends[candidates])
+    return legal
+
+
+def are_legal_legs(starts: np.ndarray, ends: np.ndarray, enemies: List[Enemy]) -> np.ndarray:
+    """Assert, for a batch of movements, which of them are legal regarding all enemies
+
+    Large batches are split into chunks that are checked concurrently. The heavy lifting is done inside NumPy and GEOS,
+    which both release the GIL, so threads are enough to use all cores.
+
+    :param starts: array of shape (M, 2) holding the start of every movement
+    :param ends: array of shape (M, 2) holding the destination of every movement
+    :param enemies: enemies to be considered
+    :return: boolean array of shape (M,), True for every legal movement
+    """
+    if len(starts) <= LEGS_PER_CHUNK:
+        return _are_legal_legs_chunk(starts, ends, enemies)
+
+    chunks = [(starts[i:i + LEGS_PER_CHUNK], ends[i:i + LEGS_PER_CHUNK]) for i in range(0, len(starts), LEGS_PER_CHUNK)]
+    with ThreadPoolExecutor() as executor:
+        return np.concatenate(list(executor.map(lambda chunk: _are_legal_legs_chunk(*chunk, enemies), chunks)))
 
 
 # Stage 2 methods
 
 
-def sample_in_polygon(polygon: Polygon) -> Coordinate:
-    """Sample a coordinate uniformly inside a polygon
+def sample_in_polygon(polygon: Polygon, n: int) -> List[Coordinate]:
+    """Sample coordinates uniformly inside a polygon
 
     :param polygon: polygon to be sampled inside
-    :return: sampled <code>Coordinate</code>
+    :param n: amount of coordinates to sample
+    :return: list of <code>n</code> sampled coordinates
     """
 
     # Note: this method of sampling is called `reject sampling`, where we sample uniformly in the bounding box of the
-    # polygon and return the sampled point only if it happens to fall inside the polygon.
+    # polygon and keep the sampled point only if it happens to fall inside the polygon.
     # There are more advanced and efficient methods, you can take it as a thought exercise to think of one - but don't
     # put into it much time before you finish this stage.
 
+    # Candidates are sampled and tested in batches, so the polygon is queried once per batch instead of once per point
     left, bottom, right, top = polygon.bounds
-    while True:
-        x = random.uniform(left, right)
-        y = random.uniform(bottom, top)
-        if polygon.contains(Point(x, y)):
-            return Coordinate(x, y)
-
-
-def add_nodes_inside_radars(graph: nx.DiGraph, enemies: List[Enemy]) -> None:
+    xs, ys = [np.empty(0)], [np.empty(0)]
+    accepted = 0
+    while accepted < n:
+        batch_xs = np.random.uniform(left, right, 4 * n)
+        batch_ys = np.random.uniform(bottom, top, 4 * n)
+        inside = shapely.contains_xy(polygon, batch_xs, batch_ys)
+        xs.append(batch_xs[inside])
+        ys.append(batch_ys[inside])
+        accepted += np.count_nonzero(inside)
+
+    xs, ys = np.concatenate(xs)[:n], np.concatenate(ys)[:n]
+    return [Coordinate(x, y) for x, y in zip(xs.tolist(), ys.tolist())]
+
+
+def add_nodes_inside_radars(graph: nx.DiGraph, nodes: List[Coordinate],
+                            enemies: List[Enemy]) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
     """Add nodes and edges for movement inside radars
 
     :param graph: current graph
+    :param nodes: nodes of the graph, where the index of every node is its id. Sampled nodes are appended to it
     :param enemies: list of enemies to be avoided
-    :return: None
+    :return: added edges, as arrays of the ids of their start nodes, the ids of their end nodes and their distances
     """
     # Filter radars. If none exist, yield
     radars = [enemy for enemy in enemies if isinstance(enemy, Radar)]
     if len(radars) == 0:
-        return
+        return np.empty(0, dtype=int), np.empty(0, dtype=int), np.empty(0)
 
     # Add new nodes to graph
     new_nodes = []
     samples_per_radar = SAMPLES // len(radars)
     for radar in radars:
-        new_nodes += [sample_in_polygon(radar.circle) for _ in range(samples_per_radar)]
-
-    # Iteratively, sample nodes and try connecting them to the graph
-    for node in tqdm(new_nodes):
-
-        # Add node to the graph
-        graph.add_node(node)
-        for other in graph.nodes:
-
-            # Skip current node and nodes further than EDGE_RADIUS from it
-            if other == node or node.distance_to(other) > EDGE_RADIUS:
-                continue
-
-            # Connect edge in both directions
-            dist = node.distance_to(other)
-            if is_legal_leg(other, node, enemies):
-                graph.add_edge(other, node, dist=dist)
-            if is_legal_leg(node, other, enemies):
-                graph.add_edge(node, other, dist=dist)
+        new_nodes += sample_in_polygon(radar.circle, samples_per_radar)
+
+    # Index all nodes, existing and new, in a k-d tree so that only pairs of nodes within EDGE_RADIUS are considered.
+    # New nodes are connected as if they were added to the graph one by one, i.e. every node is connected only to
+    # preceding nodes. In every pair the second node is the later one, so pairs of existing nodes and duplicate nodes
+    # are skipped
+    first_new = len(nodes)
+    nodes += new_nodes
+    points = Coordinate.to_array(nodes)
+    graph.add_nodes_from(new_nodes)
+    pairs = cKDTree(points).query_pairs(EDGE_RADIUS, output_type='ndarray')
+    others, indices = pairs[:, 0], pairs[:, 1]
+    keep = (indices >= first_new) & (np.abs(points[others] - points[indices]) > 1e-6).any(axis=1)
+    others, indices = others[keep], indices[keep]
+
+    # Legality does not depend on the direction of the movement along the leg, so every pair is tested once for both
+    # directions. Legs of all sampled nodes are tested at once, split between threads
+    legal = are_legal_legs(points[indices], points[others], enemies)
+    others, indices = others[legal], indices[legal]
+    dists = np.hypot(points[others, 0] - points[indices, 0], points[others, 1] - points[indices, 1])
+
+    # Connect edge in both directions
+    rows, columns = np.concatenate([others, indices]), np.concatenate([indices, others])
+    dists = np.concatenate([dists, dists])
+    graph.add_edges_from((nodes[i], nodes[j], {'dist': dist})
+                         for i, j, dist in zip(rows.tolist(), columns.tolist(), dists.tolist()))
+    return rows, columns, dists
 
 
 # Navigator
@@ -135,28 +193,40 @@ def calculate_path(source: Coordinate, target: Coordinate, enemies: List[Enemy])
     print('Adding corners to graph')
     add_enemies_to_graph(graph, enemies)
 
+    # Nodes are identified by their index in `nodes`, so that all computations work on integer ids and arrays
+    nodes = list(graph.nodes)
+    node_ids = {node: i for i, node in enumerate(nodes)}
+
     # For every pair of nodes, try to connect them
-    for node1, node2 in combinations(graph.nodes, 2):
-        # If the connection is legal, add the edge to the graph
-        if is_legal_leg(node1, node2, enemies):
-            dist = node1.distance_to(node2)
-            graph.add_edge(node1, node2, dist=dist)
-            graph.add_edge(node2, node1, dist=dist)
+    points = Coordinate.to_array(nodes)
+    first, second = np.triu_indices(len(nodes), 1)
+    legal = are_legal_legs(points[first], points[second], enemies)
+    first, second = first[legal], second[legal]
+
+    # Compute the distance of every legal pair once, for both of its directions
+    dists = np.hypot(points[second, 0] - points[first, 0], points[second, 1] - points[first, 1])
+
+    # Add the legal connections to the graph in both directions
+    edges = []
+    for i, j, dist in zip(first.tolist(), second.tolist(), dists.tolist()):
+        attributes = {'dist': dist}
+        edges += [(nodes[i], nodes[j], attributes), (nodes[j], nodes[i], attributes)]
+    graph.add_edges_from(edges)
 
     # To deal with the added problem of radars, it is not enough to just circle the threat because there may be a
     # shorter route that requires delicate maneuvering. The solution in this case is a "Probabilistic Roadmap" (PRM),
     # which is a group of motion planning algorithms. In the most basic case, we sample random coordinates in the graph
     # and try to connect them to all existing nodes within a given radius.
     print('Sampling inside radars')
-    add_nodes_inside_radars(graph, enemies)
-
-    # Try computing the shortest path
-    try:
-        print('Computing path')
-        path = nx.shortest_path(graph, source, target, weight='dist')
-    # If not path exists, return an empty path
-    except nx.NetworkXNoPath:
-        path = []
+    radar_rows, radar_columns, radar_dists = add_nodes_inside_radars(graph, nodes, enemies)
+
+    # Compute the shortest path over a sparse adjacency matrix of all the edges
+    print('Computing path')
+    rows = np.concatenate([first, second, radar_rows])
+    columns = np.concatenate([second, first, radar_columns])
+    weights = np.concatenate([dists, dists, radar_dists])
+    adjacency = csr_matrix((weights, (rows, columns)), shape=(len(nodes), len(nodes)))
+    path = [nodes[i] for i in shortest_path(adjacency, node_ids[source], node_ids[target])]
 
     print('Returning path')
     return path, graph
@@ -1,19 +1,23 @@
-import random
-from itertools import combinations
+from concurrent.futures import ThreadPoolExecutor
 from typing import List, Tuple
 
 import networkx as nx
-from shapely.geometry import Point, Polygon
-from tqdm import tqdm
+import numpy as np
+import shapely
+from scipy.sparse import csr_matrix
+from scipy.spatial import cKDTree
+from shapely.geometry import Polygon
 
 from algorithmics.enemy.asteroids_zone import AsteroidsZone
 from algorithmics.enemy.enemy import Enemy
 from algorithmics.enemy.observation_post import ObservationPost
 from algorithmics.enemy.radar import Radar
 from algorithmics.utils.coordinate import Coordinate
+from algorithmics.utils.graph import shortest_path
 
 SAMPLES = 2000
 EDGE_RADIUS = 5
+LEGS_PER_CHUNK = 20000
 
 
 # Stage 1 methods
@@ -47,41 +51,87 @@ def is_legal_leg(start: Coordinate, end: Coordinate, enemies: List[Enemy]) -> bo
     :param enemies: enemies to be considered
     :return: True if the leg is legal, False otherwise
     """
-    return all(enemy.is_legal_leg(start, end) for enemy in enemies)
+    for enemy in enemies:
+        # Try the cheap test first, and fall back to the exact one only if it is inconclusive
+        legal = enemy.fast_segment_reject(start, end)
+        if legal is None:
+            legal = enemy.is_legal_leg(start, end)
+        if not legal:
+            return False
+    return True
+
+
+def _are_legal_legs_chunk(starts: np.ndarray, ends: np.ndarray, enemies: List[Enemy]) -> np.ndarray:
+    # Every enemy tests at once all the legs that are still legal
+    legal = np.ones(len(starts), dtype=bool)
+    for enemy in enemies:
+        candidates = np.flatnonzero(legal)
+        legal[candidates] = enemy.are_legal_legs(starts[candidates], ends[candidates])
+    return legal
+
+
+def are_legal_legs(starts: np.ndarray, ends: np.ndarray, enemies: List[Enemy]) -> np.ndarray:
+    """Assert, for a batch of movements, which of them are legal regarding all enemies
+
+    Large batches are split into chunks that are checked concurrently. The heavy lifting is done inside NumPy and GEOS,
+    which both release the GIL, so threads are enough to use all cores.
+
+    :param starts: array of shape (M, 2) holding the start of every movement
+    :param ends: array of shape (M, 2) holding the destination of every movement
+    :param enemies: enemies to be considered
+    :return: boolean array of shape (M,), True for every legal movement
+    """
+    if len(starts) <= LEGS_PER_CHUNK:
+        return _are_legal_legs_chunk(starts, ends, enemies)
+
+    chunks = [(starts[i:i + LEGS_PER_CHUNK], ends[i:i + LEGS_PER_CHUNK]) for i in range(0, len(starts), LEGS_PER_CHUNK)]
+    with ThreadPoolExecutor() as executor:
+        return np.concatenate(list(executor.map(lambda chunk: _are_legal_legs_chunk(*chunk, enemies), chunks)))
 
 
 # Stage 2 methods
 
 
-def sample_in_polygon(polygon: Polygon) -> Coordinate:
-    """Sample a coordinate uniformly inside a polygon
+def sample_in_polygon(polygon: Polygon, n: int) -> List[Coordinate]:
+    """Sample coordinates uniformly inside a polygon
 
     :param polygon: polygon to be sampled inside
-    :return: sampled <code>Coordinate</code>
+    :param n: amount of coordinates to sample
+    :return: list of <code>n</code> sampled coordinates
     """
 
     # Note: this method of sampling is called `reject sampling`, where we sample uniformly in the bounding box of the
-    # polygon and return the sampled point only if it happens to fall inside the polygon.
+    # polygon and keep the sampled point only if it happens to fall inside the polygon.
     # There are more advanced and efficient methods, you can take it as a thought exercise to think of one - but don't
     # put into it much time before you finish this stage.
 
+    # Candidates are sampled and tested in batches, so the polygon is queried once per batch instead of once per point
     left, bottom, right, top = polygon.bounds
-    while True:
-        x = random.uniform(left, right)
-        y = random.uniform(bottom, top)
-        if polygon.contains(Point(x, y)):
-            return Coordinate(x, y)
-
-
-def add_nodes_inside_radars(graph: nx.DiGraph, enemies: List[Enemy]) -> None:
+    xs, ys = [np.empty(0)], [np.empty(0)]
+    accepted = 0
+    while accepted < n:
+        batch_xs = np.random.uniform(left, right, 4 * n)
+        batch_ys = np.random.uniform(bottom, top, 4 * n)
+        inside = shapely.contains_xy(polygon, batch_xs, batch_ys)
+        xs.append(batch_xs[inside])
+        ys.append(batch_ys[inside])
+        accepted += np.count_nonzero(inside)
+
+    xs, ys = np.concatenate(xs)[:n], np.concatenate(ys)[:n]
+    return [Coordinate(x, y) for x, y in zip(xs.tolist(), ys.tolist())]
+
+
+def add_nodes_inside_radars(graph: nx.DiGraph, nodes: List[Coordinate], radars: List[Radar],
+                            no_entrances: List[Enemy]) -> None:
     """Add nodes and edges for movement inside radars
 
     :param graph: current graph
-    :param enemies: list of enemies to be avoided
+    :param nodes: nodes of the graph, where the index of every node is its id. Sampled nodes are appended to it
+    :param radars: list of radars, where movement is allowed but detected
+    :param no_entrances: list of enemies to be avoided entirely
     :return: None
     """
-    # Filter radars. If none exist, yield
-    radars = [enemy for enemy in enemies if isinstance(enemy, Radar)]
+    # If no radars exist, yield
     if len(radars) == 0:
         return
 
@@ -89,115 +139,127 @@ def add_nodes_inside_radars(graph: nx.DiGraph, enemies: List[Enemy]) -> None:
     new_nodes = []
     samples_per_radar = SAMPLES // len(radars)
     for radar in radars:
-        new_nodes += [sample_in_polygon(radar.circle) for _ in range(samples_per_radar)]
-
-    # Iteratively, sample nodes and try connecting them to the graph
-    for node in tqdm(new_nodes):
-
-        # Add node to the graph
-        graph.add_node(node)
-        for other in graph.nodes:
-
-            # Skip current node and nodes further than EDGE_RADIUS from it
-            if other == node or node.distance_to(other) > EDGE_RADIUS:
-                continue
-
-            # If leg crosses a no-entrance, skip it
-            if not is_leg_legal_only_no_entrances(node, other, enemies):
-                continue
-
-            # Connect edge in both directions
-            dist = node.distance_to(other)
-            graph.add_edge(other, node, dist=dist, detected=not is_leg_legal_only_radars(other, node, enemies))
-            graph.add_edge(node, other, dist=dist, detected=not is_leg_legal_only_radars(node, other, enemies))
+        new_nodes += sample_in_polygon(radar.circle, samples_per_radar)
+
+    # Index all nodes, existing and new, in a k-d tree so that only pairs of nodes within EDGE_RADIUS are considered. New
+    # nodes are connected as if they were added to the graph one by one, i.e. every node is connected only to preceding
+    # nodes. In every pair the second node is the later one, so pairs of existing nodes and duplicate nodes are skipped
+    first_new = len(nodes)
+    nodes += new_nodes
+    points = Coordinate.to_array(nodes)
+    graph.add_nodes_from(new_nodes)
+    pairs = cKDTree(points).query_pairs(EDGE_RADIUS, output_type='ndarray')
+    others, indices = pairs[:, 0], pairs[:, 1]
+    keep = (indices >= first_new) & (np.abs(points[others] - points[indices]) > 1e-6).any(axis=1)
+    others, indices = others[keep], indices[keep]
+
+    # If leg crosses a no-entrance, skip it. Legs of all sampled nodes are tested at once, split between threads
+    legal = are_legal_legs(points[indices], points[others], no_entrances)
+    others, indices = others[legal], indices[legal]
+
+    # Radar detection does not depend on the direction of the movement along the leg, so it is tested once for both
+    # directions, as is the distance
+    detected = ~are_legal_legs(points[indices], points[others], radars)
+    dists = np.hypot(points[others, 0] - points[indices, 0], points[others, 1] - points[indices, 1])
+
+    # Connect edge in both directions
+    edges = []
+    for other_index, index, dist, is_detected in zip(others.tolist(), indices.tolist(), dists.tolist(),
+                                                     detected.tolist()):
+        attributes = {'dist': dist, 'detected': is_detected}
+        edges += [(nodes[other_index], nodes[index], attributes), (nodes[index], nodes[other_index], attributes)]
+    graph.add_edges_from(edges)
 
 
 # Stage 3 methods
 
 
-def is_leg_legal_only_no_entrances(start: Coordinate, end: Coordinate, enemies: List[Enemy]) -> bool:
+def is_leg_legal_only_no_entrances(start: Coordinate, end: Coordinate, no_entrances: List[Enemy]) -> bool:
     """Assert that the movement from start to end is legal, regarding only no-entrances
 
     :param start: start of the movement
     :param end: destination of the movement
-    :param enemies: enemies to be considered
+    :param no_entrances: no-entrances to be considered, i.e. all enemies but radars
     :return: True if the leg is legal, False otherwise
     """
-    return all(enemy.is_legal_leg(start, end) for enemy in enemies if not isinstance(enemy, Radar))
+    return is_legal_leg(start, end, no_entrances)
 
 
-def is_leg_legal_only_radars(start: Coordinate, end: Coordinate, enemies: List[Enemy]) -> bool:
+def is_leg_legal_only_radars(start: Coordinate, end: Coordinate, radars: List[Radar]) -> bool:
     """Assert that the movement from start to end is legal, regarding only radars
 
     :param start: start of the movement
     :param end: destination of the movement
-    :param enemies: enemies to be considered
+    :param radars: radars to be considered
     :return: True if the leg is legal, False otherwise
     """
-    return all(enemy.is_legal_leg(start, end) for enemy in enemies if isinstance(enemy, Radar))
+    return is_legal_leg(start, end, radars)
 
 
-def add_legal_edge(graph: nx.DiGraph, max_detection: float, quanta: float, start: Coordinate, end: Coordinate,
-                   dist: float) -> None:
-    """Add a legal edge to layers graph
+def layer_legal_edges(layers_amount: int, nodes_amount: int, starts: np.ndarray, ends: np.ndarray,
+                      dists: np.ndarray) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+    """Compute the edges of the layers graph for legal edges of the initial graph
 
-    :param graph: layers graph
-    :param max_detection: maximum allowed detection in path
-    :param quanta: quanta of detection
-    :param start: start of the edge
-    :param end: end of the edge
-    :param dist: distance between start and end
-    :return: None
+    Every legal edge is added inside every layer of the layers graph.
+
+    :param layers_amount: amount of layers in the graph
+    :param nodes_amount: amount of nodes in the initial graph
+    :param starts: ids of the starts of the edges
+    :param ends: ids of the ends of the edges
+    :param dists: distances between starts and ends
+    :return: ids of the starts of the layers graph's edges, ids of their ends and their distances
     """
-    layer = 0.0
-    # For every layer in the graph, add the edge inside the layer
-    while layer <= max_detection:
-        graph.add_edge(f'{start}_{layer}', f'{end}_{layer}', dist=dist)
-        layer += quanta
+    offsets = np.arange(layers_amount)[:, None] * nodes_amount
+    return (offsets + starts).ravel(), (offsets + ends).ravel(), np.tile(dists, layers_amount)
+
 
+def layer_detected_edges(layers_amount: int, nodes_amount: int, quanta: float, starts: np.ndarray, ends: np.ndarray,
+                         dists: np.ndarray) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+    """Compute the edges of the layers graph for detected edges of the initial graph
 
-def add_detected_edge(graph: nx.DiGraph, max_detection: float, quanta: float, start: Coordinate, end: Coordinate,
-                      dist: float) -> None:
-    """Add an illegal edge to layers graph
+    Every detected edge connects every layer to the next layer fitting its detection, where detection is rounded up to
+    a multiple of quanta.
 
-    :param graph: layers graph
-    :param max_detection: maximum allowed detection in path
+    :param layers_amount: amount of layers in the graph
+    :param nodes_amount: amount of nodes in the initial graph
     :param quanta: quanta of detection
-    :param start: start of the edge
-    :param end: end of the edge
-    :param dist: distance between start and end
-    :return: None
+    :param starts: ids of the starts of the edges
+    :param ends: ids of the ends of the edges
+    :param dists: distances between starts and ends
+    :return: ids of the starts of the layers graph's edges, ids of their ends and their distances
     """
 
-    # Compute edge detection
-    detection = dist
-    # If detection is not a multiple of quanta, round up
-    if detection % quanta > 0:
-        detection = (detection // quanta + 1) * quanta
+    # Compute edge detection in whole quanta units, rounding up detection that is not a multiple of quanta
+    steps = np.ceil(dists / quanta).astype(int)
 
-    layer = 0.0
-    # Add edge between every layer to next fitting layer
-    while layer + detection <= max_detection:
-        graph.add_edge(f'{start}_{layer}', f'{end}_{layer + detection}', dist=dist)
-        layer += quanta
+    # Connect every layer to the layer of the detection added to it, as long as it is not beyond the last layer
+    layers, edges = np.nonzero(np.arange(layers_amount)[:, None] + steps < layers_amount)
+    return (layers * nodes_amount + starts[edges], (layers + steps[edges]) * nodes_amount + ends[edges],
+            dists[edges])
 
 
-def add_target_edges(graph: nx.DiGraph, layers: List[float], target: Coordinate) -> None:
-    """Add edges connecting between targets in different layers to the layers graph
+def layer_target_edges(layers_amount: int, nodes_amount: int,
+                       target: int) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+    """Compute the edges connecting between targets in different layers of the layers graph
 
-    :param graph: layers graph
-    :param layers: list of layers' detection values
-    :param target: target node in initial graph
-    :return: None
+    :param layers_amount: amount of layers in the graph
+    :param nodes_amount: amount of nodes in the initial graph
+    :param target: id of the target node in initial graph
+    :return: ids of the starts of the layers graph's edges, ids of their ends and their distances
     """
-    for layer, next_layer in zip(layers, layers[1:]):
-        graph.add_edge(f'{target}_{layer}', f'{target}_{next_layer}', dist=0)
+    layers = np.arange(layers_amount - 1)
+    return layers * nodes_amount + target, (layers + 1) * nodes_amount + target, np.zeros(layers_amount - 1)
 
 
 def build_layers_graph(graph: nx.DiGraph, source: Coordinate, target: Coordinate, max_detection_percentage=0.1,
-                       quanta: float = 0.5) -> Tuple[nx.DiGraph, str, str]:
+                       quanta: float = 0.5) -> Tuple[csr_matrix, int, int]:
     """Build a layers graph over initial graph
 
+    Nodes of the initial graph are identified by their index in `graph.nodes`. The layers graph holds a copy of every
+    node in every layer, where the layer of index i stands for a detection of i quantas, and the copy of node n in
+    layer i is identified by `i * len(graph.nodes) + n`. All edges are computed at once, and the layers graph is
+    returned as a sparse adjacency matrix.
+
     :param graph: initial graph to build a layers graph from
     :param source: source of the path search
     :param target: target of the path search
@@ -209,46 +271,45 @@ def build_layers_graph(graph: nx.DiGraph, source: Coordinate, target: Coordinate
     # Compute value of maximal detection distance
     max_detection = source.distance_to(target) * max_detection_percentage
 
-    # Initialize layers graph and add its nodes
-    layers_graph = nx.DiGraph()
     # We have layers from 0 to max_detection with deltas of quanta between consecutive layers
-    layers = [quanta * i for i in range(int(max_detection // quanta) + 1)]
-    for layer in layers:
-        layers_graph.add_nodes_from([f'{node}_{layer}' for node in graph.nodes])
-
-    # For every edge in the initial graph, add it to the layers graph
-    for edge, attributes in tqdm(graph.edges.items()):
-
-        start, end = edge
-        distance = attributes['dist']
-
-        # If the edge is detected, we add it as a connection between layers
-        if attributes['detected']:
-            add_detected_edge(layers_graph, max_detection, quanta, start, end, distance)
-
-        # If the edge is legal, we add it as an inside edge in every level
-        else:
-            add_legal_edge(layers_graph, max_detection, quanta, start, end, distance)
-
-    # Add target connecting edges to allow transformation to last-layer target
-    add_target_edges(layers_graph, layers, target)
+    layers_amount = int(max_detection // quanta) + 1
+    nodes_amount = graph.number_of_nodes()
+    node_ids = {node: i for i, node in enumerate(graph.nodes)}
+
+    # Collect the edges of the initial graph
+    starts, ends, dists, detected = [], [], [], []
+    for start, end, attributes in graph.edges(data=True):
+        starts.append(node_ids[start])
+        ends.append(node_ids[end])
+        dists.append(attributes['dist'])
+        detected.append(attributes['detected'])
+    starts, ends, dists, detected = np.array(starts, dtype=int), np.array(ends, dtype=int), np.array(dists), \
+        np.array(detected, dtype=bool)
+
+    # Legal edges are added as inside edges in every level, detected edges as connections between layers, and target
+    # connecting edges allow transformation to last-layer target
+    edges = [layer_legal_edges(layers_amount, nodes_amount, starts[~detected], ends[~detected], dists[~detected]),
+             layer_detected_edges(layers_amount, nodes_amount, quanta, starts[detected], ends[detected],
+                                  dists[detected]),
+             layer_target_edges(layers_amount, nodes_amount, node_ids[target])]
+    rows, columns, weights = (np.concatenate(parts) for parts in zip(*edges))
+    layers_size = layers_amount * nodes_amount
+    layers_graph = csr_matrix((weights, (rows, columns)), shape=(layers_size, layers_size))
 
     # Return layers graph and its source and target
-    return layers_graph, f'{source}_0.0', f'{target}_{layers[-1]}'
+    return layers_graph, node_ids[source], (layers_amount - 1) * nodes_amount + node_ids[target]
 
 
-def retrieve_path_from_layered_path(path: List[str]) -> List[Coordinate]:
+def retrieve_path_from_layered_path(path: List[int], nodes: List[Coordinate]) -> List[Coordinate]:
     """Retrieve a path in the original graph, given a grpah in the layers graph
 
     :param path: path in the layers graph
+    :param nodes: nodes of the original graph, by their ids
     :return: equivalent path in the original graph
     """
 
-    # Remove layer value from every node
-    path = [s.split('_')[0] for s in path]
-
-    # Create coordinates from the nodes
-    path = [Coordinate.from_str(s) for s in path]
+    # Remove layer from every node
+    path = [nodes[node_id % len(nodes)] for node_id in path]
 
     # Remove every duplication of target in the end of the path
     while path[-1] == path[-2]:
@@ -282,36 +343,45 @@ def calculate_path(source: Coordinate, target: Coordinate, enemies: List[Enemy])
     print('Adding corners to graph')
     add_enemies_to_graph(graph, enemies)
 
+    # Split the enemies once, as movement inside radars is allowed while other enemies must be avoided entirely
+    radars = [enemy for enemy in enemies if isinstance(enemy, Radar)]
+    no_entrances = [enemy for enemy in enemies if not isinstance(enemy, Radar)]
+
+    # Nodes are identified by their index in `nodes`, which follows the order of `graph.nodes`
+    nodes = list(graph.nodes)
+
     # For every pair of nodes, try to connect them
-    for node1, node2 in combinations(graph.nodes, 2):
-        # If the connection is not legal, skip the pair
-        if not is_legal_leg(node1, node2, enemies):
-            continue
+    points = Coordinate.to_array(nodes)
+    first, second = np.triu_indices(len(nodes), 1)
+    legal = are_legal_legs(points[first], points[second], enemies)
+    first, second = first[legal], second[legal]
+
+    # Compute the distance of every legal pair once, for both of its directions
+    dists = np.hypot(points[second, 0] - points[first, 0], points[second, 1] - points[first, 1])
 
-        # Otherwise, add the edge to the graph
-        dist = node1.distance_to(node2)
-        graph.add_edge(node1, node2, dist=dist, detected=False)
-        graph.add_edge(node2, node1, dist=dist, detected=False)
+    # Add the legal connections to the graph in both directions
+    edges = []
+    for i, j, dist in zip(first.tolist(), second.tolist(), dists.tolist()):
+        attributes = {'dist': dist, 'detected': False}
+        edges += [(nodes[i], nodes[j], attributes), (nodes[j], nodes[i], attributes)]
+    graph.add_edges_from(edges)
 
     # To deal with the added problem of radars, it is not enough to just circle the threat because there maybe a shorter
     # route that requires delicate maneuvering. The solution in this case is a "Probabalistic Roadmap" (PRM). This is a
     # group of motion planning algorithms. In the most basic case, we sample random coordinates in the graph and try to
     # connect them to all existing nodes within a given radius.
     print('Sampling inside radars')
-    add_nodes_inside_radars(graph, enemies)
+    add_nodes_inside_radars(graph, nodes, radars, no_entrances)
 
     # Build a layers graph
     print('Building layers graph')
     layers_graph, source, target = build_layers_graph(graph, source, target)
 
-    # Try computing the shortest path
-    try:
-        print('Computing path')
-        path = nx.shortest_path(layers_graph, source, target, weight='dist')
-        path = retrieve_path_from_layered_path(path)
-    # If not path exists, return an empty path
-    except nx.NetworkXNoPath:
-        path = []
+    # Compute the shortest path in the layers graph. If no path exists, return an empty path. The search runs in the
+    # compiled Dijkstra of scipy and takes milliseconds even over all the layers, so it is not pruned by a heuristic
+    print('Computing path')
+    path = shortest_path(layers_graph, source, target)
+    path = retrieve_path_from_layered_path(path, nodes) if path else []
 
     print('Returning path')
     return path, graph
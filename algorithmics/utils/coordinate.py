@@ -1,4 +1,7 @@
 import math
+from typing import Iterable, List, Sequence, Union
+
+import numpy as np
 
 
 class Coordinate:
@@ -52,6 +55,8 @@ class Coordinate:
     ('Coordiante(x=1.0, y=4.0)', 'Coordinate(x=1.0, y=4.0)')
     """
 
+    __slots__ = ('x', 'y')
+
     def __init__(self, x: float, y: float) -> None:
         """Initializes a coordinate given its `x`, `y` values
 
@@ -94,22 +99,35 @@ class Coordinate:
     def distance_to(self, other: 'Coordinate') -> float:
         """Computes the euclidean distance to the other coordinate
         """
-        return math.sqrt((self.x - other.x) ** 2 + (self.y - other.y) ** 2)
+        return math.hypot(self.x - other.x, self.y - other.y)
 
     def direction_to(self, other: 'Coordinate') -> float:
         """Computes the direction to the other coordinate
         """
         return math.atan2(other.y - self.y, other.x - self.x)
 
+    def distance_to_segment(self, start: 'Coordinate', end: 'Coordinate') -> float:
+        """Computes the euclidean distance to the segment between start and end
+        """
+        dx, dy = end.x - start.x, end.y - start.y
+        length_squared = dx ** 2 + dy ** 2
+        if length_squared == 0:
+            return self.distance_to(start)
+
+        # Project this coordinate on the segment, clamping the projection to the segment itself
+        t = min(1.0, max(0.0, ((self.x - start.x) * dx + (self.y - start.y) * dy) / length_squared))
+        return math.sqrt((start.x + t * dx - self.x) ** 2 + (start.y + t * dy - self.y) ** 2)
+
     def distance_to_squared(self, other: 'Coordinate') -> float:
         """Computes the square of the euclidean distance to the other coordinate
         """
-        return (self.x - other.x) ** 2 + (self.y - other.y) ** 2
+        dx, dy = self.x - other.x, self.y - other.y
+        return dx * dx + dy * dy
 
     def norm(self) -> float:
         """Computes the norm of this 2d vector
         """
-        return math.sqrt(self.x ** 2 + self.y ** 2)
+        return math.hypot(self.x, self.y)
 
     def __str__(self) -> str:
         return f'Coordinate(x={self.x}, y={self.y})'
@@ -139,5 +157,25 @@ class Coordinate:
         # Return coordinate object
         return Coordinate(x, y)
 
+    @classmethod
+    def from_pairs(cls, pairs: Union[Iterable[Sequence[float]], np.ndarray]) -> List['Coordinate']:
+        """Create coordinates from pairs of x, y values
+
+        :param pairs: pairs of x, y values, such as a list of lists or an array of shape (N, 2)
+        :return: list of coordinate objects
+        """
+        if isinstance(pairs, np.ndarray):
+            pairs = pairs.tolist()
+        return [cls(pair[0], pair[1]) for pair in pairs]
+
+    @staticmethod
+    def to_array(coordinates: Iterable['Coordinate']) -> np.ndarray:
+        """Collect the x, y values of coordinates into an array
+
+        :param coordinates: coordinates to be collected
+        :return: array of shape (N, 2) holding the x, y values of every coordinate
+        """
+        return np.array([[c.x, c.y] for c in coordinates], dtype=np.float64).reshape(-1, 2)
+
     def __hash__(self) -> int:
         return hash(self.x) ^ hash(self.y)
@@ -0,0 +1,98 @@
+import functools
+import math
+from typing import Tuple, Union
+
+import numpy as np
+
+
+@functools.lru_cache(maxsize=8)
+def unit_circle(n: int) -> Tuple[np.ndarray, np.ndarray]:
+    """Compute the sines and cosines of `n` angles evenly spread around the circle
+
+    The i-th angle is `i * 2π / n`. The returned tables are cached and therefore read-only.
+
+    :param n: number of angles
+    :return: table of sines and table of cosines of the angles
+    """
+    angles = np.arange(n) * (2 * math.pi / n)
+    sines, cosines = np.sin(angles), np.cos(angles)
+    sines.flags.writeable = False
+    cosines.flags.writeable = False
+    return sines, cosines
+
+
+def segments_clear_of_circles(starts: np.ndarray, ends: np.ndarray, centers: np.ndarray,
+                              radii: np.ndarray) -> np.ndarray:
+    """Check, for a batch of segments, which of them keep out of all the given circles
+
+    :param starts: array of shape (M, 2) holding the start point of every segment
+    :param ends: array of shape (M, 2) holding the end point of every segment
+    :param centers: array of shape (K, 2) holding the center of every circle
+    :param radii: array of shape (K,) holding the radius of every circle
+    :return: boolean array of shape (M,), True for every segment that does not enter any of the circles
+    """
+    # Coordinates are split into contiguous arrays of x and y values, so every operation below runs over contiguous
+    # arrays of shape (M,). Float64 is kept, as the tolerance of 1e-6 is finer than the precision of float32
+    start_xs, start_ys = np.ascontiguousarray(starts[:, 0]), np.ascontiguousarray(starts[:, 1])
+    dxs, dys = ends[:, 0] - start_xs, ends[:, 1] - start_ys
+    lengths_squared = dxs * dxs + dys * dys
+    # Degenerate segments have no direction, so their projection is simply their start point
+    lengths_squared[lengths_squared == 0] = 1
+
+    clear = np.ones(len(starts), dtype=bool)
+    for (center_x, center_y), radius in zip(centers.tolist(), radii.tolist()):
+        # Project the center on every segment, clamping the projection to the segment itself
+        offset_xs, offset_ys = center_x - start_xs, center_y - start_ys
+        t = np.clip((offset_xs * dxs + offset_ys * dys) / lengths_squared, 0, 1)
+
+        # A segment is clear of the circle if its closest point to the center is not inside the circle
+        gap_xs, gap_ys = offset_xs - t * dxs, offset_ys - t * dys
+        clear &= gap_xs * gap_xs + gap_ys * gap_ys >= (radius - 1e-6) ** 2
+
+    return clear
+
+
+def classify_segments_against_polygon(starts: np.ndarray, ends: np.ndarray,
+                                      edges: np.ndarray) -> Tuple[np.ndarray, np.ndarray]:
+    """Classify a batch of segments by the way they meet the boundary of a polygon
+
+    A segment properly crosses the boundary if it passes from one side of an edge to the other, at a point interior to
+    both the segment and the edge. A segment touches the boundary if it meets it in any other way, e.g. at a vertex or
+    along an edge (meeting within 1e-6 is considered touching).
+
+    :param starts: array of shape (M, 2) holding the start point of every segment
+    :param ends: array of shape (M, 2) holding the end point of every segment
+    :param edges: array of shape (E, 2, 2) holding the start and end points of every edge of the polygon
+    :return: two boolean arrays of shape (M,), marking the segments crossing the boundary and those touching it
+    """
+    # As for circles, every operation runs over contiguous arrays of x and y values
+    start_xs, start_ys = np.ascontiguousarray(starts[:, 0]), np.ascontiguousarray(starts[:, 1])
+    end_xs, end_ys = np.ascontiguousarray(ends[:, 0]), np.ascontiguousarray(ends[:, 1])
+    dxs, dys = end_xs - start_xs, end_ys - start_ys
+    lengths = np.hypot(dxs, dys)
+
+    crossing = np.zeros(len(starts), dtype=bool)
+    touching = np.zeros(len(starts), dtype=bool)
+    for (a_x, a_y), (b_x, b_y) in edges.tolist():
+        edge_dx, edge_dy = b_x - a_x, b_y - a_y
+        edge_length = math.hypot(edge_dx, edge_dy)
+        edge_separates_segment = _side(edge_dx, edge_dy, edge_length, start_xs - a_x, start_ys - a_y) * \
+            _side(edge_dx, edge_dy, edge_length, end_xs - a_x, end_ys - a_y)
+        segment_separates_edge = _side(dxs, dys, lengths, a_x - start_xs, a_y - start_ys) * \
+            _side(dxs, dys, lengths, b_x - start_xs, b_y - start_ys)
+        crossing |= (edge_separates_segment < 0) & (segment_separates_edge < 0)
+        touching |= (edge_separates_segment <= 0) & (segment_separates_edge <= 0)
+    return crossing, touching & ~crossing
+
+
+def _side(dx: Union[float, np.ndarray], dy: Union[float, np.ndarray], length: Union[float, np.ndarray],
+          offset_x: Union[float, np.ndarray], offset_y: Union[float, np.ndarray]) -> np.ndarray:
+    """Compute on which side of a line a point lies
+
+    The line is given by its direction and the length of that direction, and the point by its offset from any point on
+    the line. Any of the arguments may be a scalar or an array of shape (M,).
+
+    :return: 1 for the left side, -1 for the right side, and 0 for points within 1e-6 of the line
+    """
+    cross = dx * offset_y - dy * offset_x
+    return np.where(np.abs(cross) <= 1e-6 * length, 0, np.sign(cross))
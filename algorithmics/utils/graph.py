@@ -0,0 +1,25 @@
+from typing import List
+
+import numpy as np
+from scipy.sparse import spmatrix
+from scipy.sparse.csgraph import dijkstra
+
+
+def shortest_path(adjacency: spmatrix, source: int, target: int, directed: bool = True) -> List[int]:
+    """Find the shortest path between two nodes of a graph given as a sparse adjacency matrix
+
+    :param adjacency: sparse matrix of shape (N, N), where every stored entry is the weight of an edge
+    :param source: index of the source node
+    :param target: index of the target node
+    :param directed: whether the edges may only be traversed from row to column
+    :return: indices of the nodes along the path from source to target, or an empty list if no such path exists
+    """
+    distances, predecessors = dijkstra(adjacency, directed=directed, indices=source, return_predecessors=True)
+    if np.isinf(distances[target]):
+        return []
+
+    # Walk the predecessors back from the target to the source
+    path = [target]
+    while path[-1] != source:
+        path.append(int(predecessors[path[-1]]))
+    return path[::-1]
@@ -1,15 +1,20 @@
 import json
-from typing import Dict
+import os
+import tempfile
+import threading
 
 from flask import Flask, request, make_response
+from waitress import serve
+
+USERS_PATH = '../resources/users.json'
 
 app = Flask(__name__)
 
+# Registrations are read-modify-write updates of a single file, so they are serialized
+_users_lock = threading.Lock()
 
-def add_user(name: str, username: str, password: str) -> None:
-    with open('../resources/users.json', 'r') as f:
-        users = json.load(f)
 
+def add_user(name: str, username: str, password: str) -> None:
     new_user = {
         name: {
             'username': username,
@@ -17,10 +22,23 @@ def add_user(name: str, username: str, password: str) -> None:
         }
     }
 
-    users.update(new_user)
+    with _users_lock:
+        with open(USERS_PATH, 'r') as f:
+            users = json.load(f)
+
+        users.update(new_user)
 
-    with open('../resources/users.json', 'w') as f:
-        json.dump(users, f)
+        # Write to a temporary file and replace the users file with it, so readers never see a partially written file
+        fd, temp_path = tempfile.mkstemp(dir=os.path.dirname(USERS_PATH), suffix='.json')
+        try:
+            with os.fdopen(fd, 'w') as f:
+                json.dump(users, f)
+            # Temporary files are readable only by their owner, so the permissions of the users file are kept
+            os.chmod(temp_path, os.stat(USERS_PATH).st_mode & 0o777)
+            os.replace(temp_path, USERS_PATH)
+        except Exception:
+            os.remove(temp_path)
+            raise
 
 
 @app.route('/register', methods=['POST'])
@@ -33,4 +51,5 @@ def register():
 
 
 if __name__ == '__main__':
-    app.run(port=1234)
+    # Serve with a production WSGI server, which handles requests concurrently unlike the development server of Flask
+    serve(app, host='127.0.0.1', port=1234, threads=8)
@@ -1,11 +1,14 @@
-import glob
+import functools
+import itertools
 import json
 import os
 import re
+import tempfile
 import time
 from typing import Dict, List, Tuple, Optional
 
 import dash_auth
+import numpy as np
 from dash_extensions.enrich import DashProxy, TriggerTransform, MultiplexerTransform
 from flask import request
 from dash.dependencies import State, Input, Output
@@ -15,7 +18,7 @@ from algorithmics.assets.generate_scatter import generate_all_scenario_scatters,
 from algorithmics.enemy.enemy import Enemy
 
 import dash
-from dash import dcc, html, dash_table
+from dash import ctx, dcc, html, dash_table
 
 from algorithmics.enemy.asteroids_zone import AsteroidsZone
 from algorithmics.enemy.observation_post import ObservationPost
@@ -25,32 +28,47 @@ from algorithmics.utils.coordinate import Coordinate
 import plotly.graph_objects as go
 
 
-def _is_float(s: str) -> bool:
-    try:
-        float(s)
-        return True
-    except ValueError:
-        return False
+# A path holds only numbers, separated by spaces, commas and parentheses. Once those are replaced by spaces, every
+# token must be a number, so that the whole string can be parsed at once. Every number matches the pattern in a single
+# way, so that bad paths are rejected in linear time, and only ASCII digits are accepted since NumPy parses only them
+_PATH_RE = re.compile(r' *(?:-?(?:\d+(?:\.\d*)?|\.\d+)(?: +|$))*', re.ASCII)
+_PATH_SEPARATORS = str.maketrans('(),', '   ')
 
 
 def _convert_string_to_path(path_str: str) -> List[Coordinate]:
-    coordinates: List[Coordinate] = []
-    path_stripped = path_str.replace(' ', ' ').replace('(', ' ').replace(')', ' ').replace(',', ' ')
-    if not all(s.isnumeric() or s in [' ', '.', '-'] for s in path_stripped):
+    """Parse a path submitted by a user
+
+    >>> _convert_string_to_path('(0, 1.5), (-2, .5)')
+    [Coordinate(x=0.0, y=1.5), Coordinate(x=-2.0, y=0.5)]
+    >>> _convert_string_to_path('(0, \u0663)')
+    Traceback (most recent call last):
+    ...
+    ValueError: Path not in format
+    >>> _convert_string_to_path('(0, ' + '1' * 100000 + 'x)')
+    Traceback (most recent call last):
+    ...
+    ValueError: Path not in format
+
+    :param path_str: path as a string of coordinates, such as (x1, y1), (x2, y2)
+    :return: coordinates of the path
+    """
+    path_stripped = path_str.translate(_PATH_SEPARATORS)
+    if not _PATH_RE.fullmatch(path_stripped):
         raise ValueError('Path not in format')
-    numbers = [float(s) for s in path_stripped.split() if _is_float(s)]
+    numbers = np.fromstring(path_stripped, sep=' ')
     if len(numbers) % 2 != 0:
         raise ValueError('Path not in format')
-    for c1, c2 in zip(numbers[::2], numbers[1::2]):
-        coordinates.append(Coordinate(float(c1), float(c2)))
-    return coordinates
+    return Coordinate.from_pairs(numbers.reshape(-1, 2))
+
 
+_SCENARIO_RE = re.compile(r'.*scenario_(\d+)\.json')
 
+
+@functools.lru_cache(maxsize=256)
 def extract_scenario_number_from_path(path: str) -> int:
-    return int(re.match(r'.*scenario_(\d+)\.json', path).group(1))
+    return int(_SCENARIO_RE.match(path).group(1))
 
 
-scenario_files = glob.glob('../resources/scenarios/scenario_*.json')
 scenario_files = ['resources/scenarios/scenario_1.json']
 
 with open('resources/users.json', 'r') as f:
@@ -113,10 +131,13 @@ app.layout = html.Div(
                                                                   {'if': {'column_id': 'path-length'},
                                                                    'width': 'fit-content'},
                                                                   {'if': {'column_id': 'submission-time'},
-                                                                   'width': 'fit-content'},
+                                                                   'width': 'fit-content'}
+                                                              ],
+                                                              style_data_conditional=[
                                                                   {'if': {'row_index': 'odd'},
                                                                    'backgroundColor': '#3B3B3B'}
                                                               ],
+                                                              page_action='none',
                                                               style_as_list_view=True,
                                                               style_header={'font-weight': 'bold', 'color': 'white',
                                                                             'backgroundColor': '#3B3B3B'})),
@@ -141,10 +162,13 @@ app.layout = html.Div(
                                                                   {'if': {'column_id': 'path-length'},
                                                                    'width': 'fit-content'},
                                                                   {'if': {'column_id': 'submission-time'},
-                                                                   'width': 'fit-content'},
+                                                                   'width': 'fit-content'}
+                                                              ],
+                                                              style_data_conditional=[
                                                                   {'if': {'row_index': 'odd'},
                                                                    'backgroundColor': '#3B3B3B'}
                                                               ],
+                                                              page_action='none',
                                                               style_as_list_view=True,
                                                               style_header={'font-weight': 'bold', 'color': 'white',
                                                                             'backgroundColor': '#3B3B3B'})),
@@ -213,8 +237,25 @@ ERROR_STYLE = {'font-family': 'Courier New', 'font-weight': 'bold', 'font-size':
 MEH_STYLE = {'font-family': 'Courier New', 'font-weight': 'bold', 'font-size': 16, 'color': 'orange', 'margin-left': 10}
 OK_STYLE = {'font-family': 'Courier New', 'font-weight': 'bold', 'font-size': 16, 'color': 'green', 'margin-left': 10}
 
+LEADERBOARD_SIZE = 5
+
+# Leaderboard table rows of every scenario along with the version of the submissions file they were generated from,
+# kept in memory since they change only when the file does
+_leaderboard_cache: Dict[int, Tuple[Optional[Tuple[int, int]], List[Dict]]] = {}
+
+# Scenario and submissions file version of the results last sent to every user
+_sent_results_versions: Dict[str, Tuple] = {}
+
+
+def load_scenario(scenario_path: str) -> Tuple[int, Coordinate, Coordinate, List[Enemy], List[Radar]]:
+    # Scenarios are reloaded only when their file changes on disk. Enemies are returned split to no-entrance zones and
+    # radars, since paths are checked differently against each of them
+    return _load_scenario_cached(scenario_path, os.path.getmtime(scenario_path))
+
 
-def load_scenario(scenario_path: str) -> Tuple[int, Coordinate, Coordinate, List[Enemy]]:
+@functools.lru_cache(maxsize=64)
+def _load_scenario_cached(scenario_path: str, mtime: float) -> \
+        Tuple[int, Coordinate, Coordinate, List[Enemy], List[Radar]]:
     scenario_number = extract_scenario_number_from_path(scenario_path)
 
     with open(scenario_path, 'r') as f:
@@ -223,49 +264,76 @@ def load_scenario(scenario_path: str) -> Tuple[int, Coordinate, Coordinate, List
     # Parse scenario JSON
     source = Coordinate(raw_scenario['source'][0], raw_scenario['source'][1])
     target = Coordinate(raw_scenario['target'][0], raw_scenario['target'][1])
-    enemies: List[Enemy] = []
-    enemies += [ObservationPost(Coordinate(raw_post['center'][0], raw_post['center'][1]), raw_post['radius'])
-                for raw_post in raw_scenario['observation_posts']]
-    enemies += [AsteroidsZone([Coordinate(c[0], c[1]) for c in raw_zone['boundary']])
-                for raw_zone in raw_scenario['asteroids_zones']]
-    enemies += [Radar(Coordinate(raw_radar['center'][0], raw_radar['center'][1]), raw_radar['radius'])
-                for raw_radar in raw_scenario['radars']]
+    observation_posts = [ObservationPost(Coordinate(raw_post['center'][0], raw_post['center'][1]), raw_post['radius'])
+                         for raw_post in raw_scenario['observation_posts']]
+    asteroids_zones = [AsteroidsZone(Coordinate.from_pairs(raw_zone['boundary']))
+                       for raw_zone in raw_scenario['asteroids_zones']]
+    radars = [Radar(Coordinate(raw_radar['center'][0], raw_radar['center'][1]), raw_radar['radius'])
+              for raw_radar in raw_scenario['radars']]
 
-    return scenario_number, source, target, enemies
+    return scenario_number, source, target, observation_posts + asteroids_zones, radars
 
 
-def path_crosses_no_entrance(path: List[Coordinate], enemies: List[Enemy]) -> bool:
+def load_scenario_figure(scenario_path: str) -> go.Figure:
+    """Load the figure drawing a scenario, over which paths are drawn
+
+    :param scenario_path: path of the scenario file
+    :return: new figure of the scenario, which may be updated by the caller
+    """
+    # The figure is built and validated again only when the scenario file changes on disk. Callers get a copy of it,
+    # which is cheaper than building the figure from its traces
+    return go.Figure(_load_scenario_figure_cached(scenario_path, os.path.getmtime(scenario_path)))
+
+
+@functools.lru_cache(maxsize=64)
+def _load_scenario_figure_cached(scenario_path: str, mtime: float) -> go.Figure:
+    scenario_number, source, target, no_entrance_enemies, radars = load_scenario(scenario_path)
+    return go.Figure(data=generate_all_scenario_scatters(source, target, no_entrance_enemies + radars),
+                     layout=generate_graph_layout())
+
+
+def path_crosses_no_entrance(points: np.ndarray, no_entrance_enemies: List[Enemy]) -> bool:
     """Verify if the path crosses any observation posts or asteroid zones
 
-    :param path: path to be evaluated
-    :param enemies: enemies to be avoided
+    :param points: path to be evaluated, as an array of shape (N, 2)
+    :param no_entrance_enemies: observation posts and asteroid zones to be avoided
     :return: True if the path does not cross any no-entrance zone, False otherwise
     """
-    return any(any(not enemy.is_legal_leg(start, end) for enemy in enemies if not isinstance(enemy, Radar))
-               for start, end in zip(path, path[1:]))
+    # Every enemy checks all the legs of the path at once
+    return any(not enemy.are_legal_legs(points[:-1], points[1:]).all() for enemy in no_entrance_enemies)
 
 
-def compute_radar_detection_distance(path: List[Coordinate], enemies: List[Enemy]) -> float:
+def compute_radar_detection_distance(points: np.ndarray, radars: List[Radar]) -> float:
     """Compute accumulated distance of legs in radar detection
 
-    :param path: path to be verified
-    :param enemies: list of enemies to be avoided
+    :param points: path to be verified, as an array of shape (N, 2)
+    :param radars: list of radars to be avoided
     :return: accumulated distance of legs in radar detection
     """
-    return sum(start.distance_to(end) for start, end in zip(path, path[1:])
-               if any(not enemy.is_legal_leg(start, end) for enemy in enemies if isinstance(enemy, Radar)))
+    # Every radar checks all the legs of the path at once
+    detected = np.zeros(len(points) - 1, dtype=bool)
+    for radar in radars:
+        detected |= ~radar.are_legal_legs(points[:-1], points[1:])
+    return float(compute_leg_lengths(points)[detected].sum())
 
 
-def compute_path_length(path: List[Coordinate]) -> float:
+def compute_path_length(points: np.ndarray) -> float:
     """Compute distance of traversing a path
 
-    :param path: path to measure length of
+    :param points: path to measure length of, as an array of shape (N, 2)
     :return: length of the path
     """
-    total = 0.0
-    for coord1, coord2 in zip(path, path[1:]):
-        total += coord1.distance_to(coord2)
-    return total
+    return float(compute_leg_lengths(points).sum())
+
+
+def compute_leg_lengths(points: np.ndarray) -> np.ndarray:
+    """Compute the length of every leg of a path
+
+    :param points: array of shape (N, 2) holding the coordinates along the path
+    :return: array of shape (N - 1,) holding the length of every leg
+    """
+    legs = np.diff(points, axis=0)
+    return np.hypot(legs[:, 0], legs[:, 1])
 
 
 def get_submission_path(scenario_number: int) -> str:
@@ -287,10 +355,11 @@ def load_submission_dict(scenario_number: int) -> Dict:
     # Get submissions path
     submission_path = get_submission_path(scenario_number)
 
-    # If path already exists, load the data
+    # If path already exists, load the data. The file is parsed again only when it changes on disk, and callers get a
+    # copy of the cached dict since they may update it
     if os.path.exists(submission_path):
-        with open(submission_path, 'r') as f:
-            submissions = json.load(f)
+        stat = os.stat(submission_path)
+        submissions = dict(_load_submission_dict_cached(submission_path, stat.st_mtime_ns, stat.st_size))
 
     # Otherwise, create a new data dict
     else:
@@ -299,6 +368,26 @@ def load_submission_dict(scenario_number: int) -> Dict:
     return submissions
 
 
+def get_submissions_version(scenario_number: int) -> Optional[Tuple[int, int]]:
+    """Get a version of the submissions file of a scenario, which changes whenever the file is saved
+
+    :param scenario_number: scenario to be regarded
+    :return: modification time and size of the submissions file, or None if there are no submissions
+    """
+    submission_path = get_submission_path(scenario_number)
+    if not os.path.exists(submission_path):
+        return None
+
+    stat = os.stat(submission_path)
+    return stat.st_mtime_ns, stat.st_size
+
+
+@functools.lru_cache(maxsize=64)
+def _load_submission_dict_cached(submission_path: str, mtime_ns: int, size: int) -> Dict:
+    with open(submission_path, 'r') as f:
+        return json.load(f)
+
+
 def save_submission_dict(scenario_number: int, submissions: Dict) -> None:
     """Update the saved submissions file
 
@@ -311,22 +400,33 @@ def save_submission_dict(scenario_number: int, submissions: Dict) -> None:
     submissions = dict(sorted(submissions.items(),
                               key=lambda item: (item[1]['path_length'], item[1]['submission_time'])))
 
-    # Save updates submission file
-    with open(get_submission_path(scenario_number), 'w') as f:
-        json.dump(submissions, f)
-
-
-def save_path(path: List[Coordinate], scenario_number: int) -> bool:
+    # Save updates submission file. It is written to a temporary file that then replaces it, so readers never see a
+    # partially written file
+    submission_path = get_submission_path(scenario_number)
+    fd, temp_path = tempfile.mkstemp(dir=os.path.dirname(submission_path), suffix='.json')
+    try:
+        with os.fdopen(fd, 'w') as f:
+            json.dump(submissions, f, separators=(',', ':'))
+        # Temporary files are readable only by their owner, so the permissions of the submissions file are kept
+        mode = os.stat(submission_path).st_mode & 0o777 if os.path.exists(submission_path) else 0o644
+        os.chmod(temp_path, mode)
+        os.replace(temp_path, submission_path)
+    except Exception:
+        os.remove(temp_path)
+        raise
+
+
+def save_path(points: np.ndarray, scenario_number: int) -> bool:
     """Save new path to submissions file if it is an improvement over previous submissions
 
-    :param path: new path
+    :param points: new path, as an array of shape (N, 2)
     :param scenario_number: scenario to be regarded
     :return: True if this is the best path this user have submitted for this scenario, False otherwise
     """
     # Load existing submissions
     submissions = load_submission_dict(scenario_number)
 
-    path_length = compute_path_length(path)
+    path_length = compute_path_length(points)
     username = request.authorization['username']
     # If user has already submitted a legal path, verify the new path is an improvement
     if username in submissions and path_length >= submissions[username]['path_length']:
@@ -336,7 +436,7 @@ def save_path(path: List[Coordinate], scenario_number: int) -> bool:
     submissions[username] = {
         'path_length': path_length,
         'submission_time': time.time(),
-        'path': [[c.x, c.y] for c in path]
+        'path': points.tolist()
     }
 
     save_submission_dict(scenario_number, submissions)
@@ -359,6 +459,16 @@ def generate_table_data_from_submissions_file(index: int, data: Dict) -> Dict:
     }
 
 
+def generate_leaderboard_table_data(submissions: Dict) -> List[Dict]:
+    """Generate the data of the leaderboard table from the top submissions
+
+    :param submissions: submissions sorted by rank
+    :return: data of the top submissions as it appears in app tables
+    """
+    return [generate_table_data_from_submissions_file(idx + 1, data)
+            for idx, data in enumerate(itertools.islice(submissions.values(), LEADERBOARD_SIZE))]
+
+
 def extract_path_from_submissions_data(submission: Dict) -> List[Coordinate]:
     """Create path from a submission files and a desired index
 
@@ -366,7 +476,7 @@ def extract_path_from_submissions_data(submission: Dict) -> List[Coordinate]:
     :return: path
     """
 
-    return [Coordinate(c[0], c[1]) for c in submission['path']]
+    return Coordinate.from_pairs(submission['path'])
 
 
 @app.callback(Output('leaderboard-table', 'data'),
@@ -375,14 +485,24 @@ def extract_path_from_submissions_data(submission: Dict) -> List[Coordinate]:
               Input('submit-message', 'children'))
 def load_scenario_results(scenario_path: str, message: str) -> Tuple[List, List]:
     scenario_number = extract_scenario_number_from_path(scenario_path)
+    username = request.authorization['username']
+
+    # Submissions that were not saved leave the results as they are, so the tables are not reloaded for them
+    submissions_version = get_submissions_version(scenario_number)
+    version = (scenario_path, submissions_version)
+    if ctx.triggered_id == 'submit-message' and _sent_results_versions.get(username) == version:
+        return dash.no_update, dash.no_update
+    _sent_results_versions[username] = version
+
     submissions = load_submission_dict(scenario_number)
 
-    # Load leaderboard table data
-    leaderboard_table_data = [generate_table_data_from_submissions_file(idx + 1, data)
-                              for idx, data in enumerate(list(submissions.values())[:5])]
+    # Load leaderboard table data, which is generated again only when the submissions file changes
+    cached_version, leaderboard_table_data = _leaderboard_cache.get(scenario_number, (None, None))
+    if leaderboard_table_data is None or cached_version != submissions_version:
+        leaderboard_table_data = generate_leaderboard_table_data(submissions)
+        _leaderboard_cache[scenario_number] = (submissions_version, leaderboard_table_data)
 
     # Load personal table data
-    username = request.authorization['username']
     personal_table_data = [] if username not in submissions else \
         [generate_table_data_from_submissions_file(1, submissions[username])]
 
@@ -392,10 +512,7 @@ def load_scenario_results(scenario_path: str, message: str) -> Tuple[List, List]
 @app.callback(Output('scenario-graph', 'figure'),
               Input('scenario-dropdown', 'value'))
 def draw_selected_scenario(scenario_path: str) -> go.Figure:
-    scenario_number, source, target, enemies = load_scenario(scenario_path)
-
-    return go.Figure(data=generate_all_scenario_scatters(source, target, enemies),
-                     layout=generate_graph_layout())
+    return load_scenario_figure(scenario_path)
 
 
 @app.callback(Output('scenario-graph', 'figure'),
@@ -403,23 +520,24 @@ def draw_selected_scenario(scenario_path: str) -> go.Figure:
               Output('personal-table', 'selected_cells'),
               Input('leaderboard-table', 'active_cell'),
               Input('leaderboard-table', 'data'),
-              State('scenario-dropdown', 'value'))
+              State('scenario-dropdown', 'value'),
+              prevent_initial_call=True)
 def draw_leaderboard_path(active_cell: Dict, table, scenario_path: str) -> \
         Tuple[go.Figure, Optional[Dict], List]:
     if active_cell is None:
         return dash.no_update, dash.no_update, dash.no_update
 
-    scenario_number, source, target, enemies = load_scenario(scenario_path)
+    scenario_number = extract_scenario_number_from_path(scenario_path)
     submissions = load_submission_dict(scenario_number)
 
     try:
         chosen_submission_data = list(submissions.values())[int(active_cell['row'])]
         path = extract_path_from_submissions_data(chosen_submission_data)
 
-        data, layout = generate_all_scenario_scatters(source, target, enemies), generate_graph_layout()
-        data += [generate_path_scatter(path)]
+        figure = load_scenario_figure(scenario_path)
+        figure.add_trace(generate_path_scatter(path))
 
-        return go.Figure(data=data, layout=layout), None, []
+        return figure, None, []
     except IndexError:
         return dash.no_update, dash.no_update, dash.no_update
 
@@ -429,13 +547,14 @@ def draw_leaderboard_path(active_cell: Dict, table, scenario_path: str) -> \
               Output('leaderboard-table', 'selected_cells'),
               Input('personal-table', 'active_cell'),
               Input('personal-table', 'data'),
-              State('scenario-dropdown', 'value'))
+              State('scenario-dropdown', 'value'),
+              prevent_initial_call=True)
 def draw_personal_path(active_cell: Dict, table, scenario_path: str) -> \
         Tuple[go.Figure, Optional[Dict], List]:
     if active_cell is None:
         return dash.no_update, dash.no_update, dash.no_update
 
-    scenario_number, source, target, enemies = load_scenario(scenario_path)
+    scenario_number = extract_scenario_number_from_path(scenario_path)
     submissions = load_submission_dict(scenario_number)
 
     try:
@@ -443,10 +562,10 @@ def draw_personal_path(active_cell: Dict, table, scenario_path: str) -> \
         chosen_submission_data = submissions[username]
         path = extract_path_from_submissions_data(chosen_submission_data)
 
-        data, layout = generate_all_scenario_scatters(source, target, enemies), generate_graph_layout()
-        data += [generate_path_scatter(path)]
+        figure = load_scenario_figure(scenario_path)
+        figure.add_trace(generate_path_scatter(path))
 
-        return go.Figure(data=data, layout=layout), None, []
+        return figure, None, []
     except KeyError:
         return dash.no_update, dash.no_update, dash.no_update
 
@@ -471,22 +590,25 @@ def submit_button_clicked(n_clicks: int, scenario_path: str, path: str) -> Tuple
         return 'An error occurred while parsing the path, make sure you copied it correctly', ERROR_STYLE
 
     # Load scenario and assert fitting source and target
-    scenario_number, source, target, enemies = load_scenario(scenario_path)
+    scenario_number, source, target, no_entrance_enemies, radars = load_scenario(scenario_path)
     if not source == path[0]:
         return f'First coordinate in the path must be the source coordinate (x={source.x}, y={source.y})', ERROR_STYLE
     if not target == path[-1]:
         return f'Last coordinate in the path must be the target coordinate (x={target.x}, y={target.y})', ERROR_STYLE
 
+    # The path is converted to an array once, and all the checks below share it
+    points = Coordinate.to_array(path)
+
     # Verify path legality and respond accordingly
-    if path_crosses_no_entrance(path, enemies):
+    if path_crosses_no_entrance(points, no_entrance_enemies):
         return f'Path is illegal! it crosses a non-entrance zone', ERROR_STYLE
-    detection_distance = compute_radar_detection_distance(path, enemies)
+    detection_distance = compute_radar_detection_distance(points, radars)
     if detection_distance > 0:
         return f'Path is illegal! It has {round(detection_distance, 2)} miles under detection', ERROR_STYLE
 
     # Save path
-    path_length = compute_path_length(path)
-    path_improvement = save_path(path, scenario_number)
+    path_length = compute_path_length(points)
+    path_improvement = save_path(points, scenario_number)
     if not path_improvement:
         return f'Path of length {path_length} is not an improvement regarding your previous attempts :(', MEH_STYLE
 
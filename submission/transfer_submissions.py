@@ -1,21 +1,29 @@
 import glob
 import json
+import os
+from concurrent.futures import ThreadPoolExecutor
 
-if __name__ == '__main__':
 
-    submission_files = glob.glob('../resources/submissions/scenario_*.json')
+def _transfer_one(path: str) -> None:
+    # Open original file
+    with open(path, 'r') as f:
+        data = json.load(f)
+
+    # Add zero detection to every path
+    for username in data:
+        data[username]['detection'] = 0
 
-    for path in submission_files:
+    # Save the new submissions path
+    new_path = path.replace('submissions', 'submissions2')
+    with open(new_path, 'w') as f:
+        json.dump(data, f)
 
-        # Open original file
-        with open(path, 'r') as f:
-            data = json.load(f)
 
-        # Add zero detection to every path
-        for username in data:
-            data[username]['detection'] = 0
+if __name__ == '__main__':
+
+    submission_files = glob.glob('../resources/submissions/scenario_*.json')
+    os.makedirs('../resources/submissions2', exist_ok=True)
 
-        # Save the new submissions path
-        new_path = path.replace('submissions', 'submissions2')
-        with open(new_path, 'w') as f:
-            json.dump(data, f)
+    # Files are independent of each other, so they are transferred concurrently to overlap their I/O
+    with ThreadPoolExecutor(max_workers=16) as executor:
+        list(executor.map(_transfer_one, submission_files))